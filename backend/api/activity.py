@@ -0,0 +1,131 @@
+import heapq
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef, Q
+
+from recipes.models import FeedEntry, Recipe
+from users.models import Follow
+
+FANOUT_BATCH_SIZE = 1000
+
+
+def is_popular(author):
+    return author.followers_count >= settings.FEED_FANOUT_MAX_FOLLOWERS
+
+
+def fan_out(recipe):
+    """Copy a new recipe into the feeds of its author's followers.
+
+    Recipes of popular authors are only marked, and ``page`` merges them
+    in, also after the author drops below the threshold.
+    """
+    author = recipe.author
+    if author is None:
+        return
+    if is_popular(author):
+        recipe.fanned_out = False
+        Recipe.objects.filter(pk=recipe.pk).update(fanned_out=False)
+        return
+    followers = Follow.objects.filter(author=author).values_list(
+        'user_id', flat=True
+    )
+    FeedEntry.objects.bulk_create(
+        (
+            FeedEntry(
+                user_id=user_id,
+                recipe=recipe,
+                author=author,
+                pub_date=recipe.pub_date
+            )
+            for user_id in followers.iterator()
+        ),
+        batch_size=FANOUT_BATCH_SIZE,
+        ignore_conflicts=True
+    )
+
+
+def backfill(user_id, author):
+    """Seed a new follower's feed with the author's recent fanned-out
+    recipes; cheap for one follower, so popular authors are included."""
+    recent = (
+        Recipe.objects
+        .filter(author=author, fanned_out=True)
+        .order_by('-pub_date', '-id')
+        .values_list('pk', 'pub_date')[:settings.FEED_BACKFILL_SIZE]
+    )
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(
+                user_id=user_id,
+                recipe_id=recipe_id,
+                author=author,
+                pub_date=pub_date
+            )
+            for recipe_id, pub_date in recent
+        ],
+        ignore_conflicts=True
+    )
+
+
+def remove(user_id, author_id):
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def before(key, id_field):
+    """Rows strictly after ``key`` in (-pub_date, -id) order."""
+    pub_date, pk = key
+    return Q(pub_date__lt=pub_date) | Q(
+        pub_date=pub_date, **{f'{id_field}__lt': pk}
+    )
+
+
+def page(user, after, size):
+    """Up to ``size`` (pub_date, recipe_id) keys of the user's feed.
+
+    Fanned-out entries are read with one keyset query, recipes of
+    popular followed authors, and those other followed authors posted
+    while popular, with another; the two are merged here.
+    """
+    threshold = settings.FEED_FANOUT_MAX_FOLLOWERS
+    merged = Follow.objects.filter(user=user).filter(
+        Q(author__followers_count__gte=threshold) | Exists(
+            Recipe.objects.filter(author=OuterRef('author'), fanned_out=False)
+        )
+    ).values_list('author_id', 'author__followers_count')
+    popular = []
+    formerly_popular = []
+    for author_id, followers_count in merged:
+        if followers_count >= threshold:
+            popular.append(author_id)
+        else:
+            formerly_popular.append(author_id)
+    entries = FeedEntry.objects.filter(user=user).exclude(
+        author_id__in=popular
+    )
+    if after is not None:
+        entries = entries.filter(before(after, 'recipe_id'))
+    sources = [
+        entries.order_by('-pub_date', '-recipe_id')
+        .values_list('pub_date', 'recipe_id')[:size]
+    ]
+    if popular or formerly_popular:
+        recipes = Recipe.objects.filter(
+            Q(author_id__in=popular)
+            | Q(author_id__in=formerly_popular, fanned_out=False)
+        )
+        if after is not None:
+            recipes = recipes.filter(before(after, 'id'))
+        sources.append(
+            recipes.order_by('-pub_date', '-id')
+            .values_list('pub_date', 'id')[:size]
+        )
+    return list(islice(heapq.merge(*sources, reverse=True), size))
+
+
+def rebuild():
+    """Regenerate fanned-out entries for every follow; returns the count."""
+    FeedEntry.objects.all().delete()
+    for follow in Follow.objects.select_related('author').iterator():
+        backfill(follow.user_id, follow.author)
+    return FeedEntry.objects.count()
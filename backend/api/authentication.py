@@ -0,0 +1,125 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.authtoken.models import Token
+
+from users.models import User
+
+# Not cached: the hash stays out of the shared cache, and the counters
+# change through F() updates no signal reports. Both load on access.
+UNCACHED_FIELDS = ('password', 'recipes_count', 'followers_count')
+
+
+def snapshot(user):
+    return user._state.db, {
+        field.attname: getattr(user, field.attname)
+        for field in User._meta.concrete_fields
+        if field.attname not in UNCACHED_FIELDS
+    }
+
+
+def restore(entry):
+    db, values = entry
+    return User.from_db(db, list(values), list(values.values()))
+
+
+class TokenUserCache:
+    """Token key -> user snapshot, in a short-lived per-worker LRU in
+    front of an optional shared cache.
+
+    ``invalidate`` clears this worker and the shared cache; other
+    workers' local copies expire within ``AUTH_TOKEN_CACHE_LOCAL_TTL``.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = OrderedDict()
+
+    @property
+    def shared(self):
+        if settings.AUTH_TOKEN_CACHE_ALIAS is None:
+            return None
+        return caches[settings.AUTH_TOKEN_CACHE_ALIAS]
+
+    @staticmethod
+    def shared_key(key):
+        # Raw tokens are credentials; they do not go into cache keys.
+        return 'auth-token:' + hashlib.sha256(key.encode()).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.local.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self.local.move_to_end(key)
+                    return restore(value)
+                del self.local[key]
+        if self.shared is None:
+            return None
+        value = self.shared.get(self.shared_key(key))
+        if value is None:
+            return None
+        self.set_local(key, value)
+        return restore(value)
+
+    def set(self, key, user):
+        value = snapshot(user)
+        if self.shared is not None:
+            self.shared.set(
+                self.shared_key(key), value, settings.AUTH_TOKEN_CACHE_TIMEOUT
+            )
+        self.set_local(key, value)
+
+    def set_local(self, key, value):
+        with self.lock:
+            self.local[key] = (
+                time.monotonic() + settings.AUTH_TOKEN_CACHE_LOCAL_TTL, value
+            )
+            self.local.move_to_end(key)
+            while len(self.local) > settings.AUTH_TOKEN_CACHE_LOCAL_SIZE:
+                self.local.popitem(last=False)
+
+    def invalidate(self, *keys):
+        """Drop ``keys`` now and again on commit: a request reading the
+        old row meanwhile may have cached it back."""
+        self.forget(keys)
+        transaction.on_commit(partial(self.forget, keys))
+
+    def forget(self, keys):
+        with self.lock:
+            for key in keys:
+                self.local.pop(key, None)
+        if self.shared is not None and keys:
+            self.shared.delete_many([self.shared_key(key) for key in keys])
+
+    def invalidate_user(self, user_id):
+        self.invalidate(*Token.objects.filter(
+            user_id=user_id
+        ).values_list('key', flat=True))
+
+
+token_cache = TokenUserCache()
+
+
+class CachingTokenAuthentication(TokenAuthentication):
+    """``TokenAuthentication`` without the Token + User query on a hit.
+
+    Entries are dropped when the token is deleted (logout) and whenever
+    the user is saved: password change, deactivation.
+    """
+
+    def authenticate_credentials(self, key):
+        user = token_cache.get(key)
+        if user is None:
+            user, token = super().authenticate_credentials(key)
+            token_cache.set(key, user)
+            return user, token
+        return user, Token(key=key, user=user)
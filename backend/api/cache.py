@@ -0,0 +1,200 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.http import HttpResponse
+from django.utils.cache import (get_conditional_response, patch_vary_headers,
+                                quote_etag)
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.renderers import JSONRenderer
+
+from recipes.models import Tag
+
+from .versions import table_versions
+
+
+class ReferenceCache:
+    """Two-level cache of rendered JSON bodies for reference endpoints.
+
+    A bounded per-worker LRU answers most hits without leaving the
+    process; misses fall through to the shared Django cache, whose keys
+    carry the table version that ``invalidate`` bumps.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.lock = threading.Lock()
+        self.local = OrderedDict()
+
+    @property
+    def shared(self):
+        return caches[settings.REFERENCE_CACHE_ALIAS]
+
+    def get_version(self):
+        return table_versions.get(self.prefix)
+
+    def shared_key(self, key, version):
+        return f'reference:{self.prefix}:{version}:{key}'
+
+    def get(self, key, version=None):
+        """Body of ``key`` at ``version``, the current one by default.
+
+        Local entries remember their version: another worker's write
+        bumps it without clearing this worker's LRU.
+        """
+        if version is None:
+            version = self.get_version()
+        with self.lock:
+            entry = self.local.get(key)
+            if entry is not None:
+                expires_at, entry_version, body = entry
+                if (
+                    entry_version == version
+                    and expires_at > time.monotonic()
+                ):
+                    self.local.move_to_end(key)
+                    return body
+                del self.local[key]
+        body = self.shared.get(self.shared_key(key, version))
+        if body is not None:
+            self.set_local(key, version, body)
+        return body
+
+    def set(self, key, body, version=None):
+        if version is None:
+            version = self.get_version()
+        self.shared.set(
+            self.shared_key(key, version),
+            body,
+            settings.REFERENCE_CACHE_TIMEOUT
+        )
+        self.set_local(key, version, body)
+
+    def set_local(self, key, version, body):
+        with self.lock:
+            self.local[key] = (
+                time.monotonic() + settings.REFERENCE_CACHE_LOCAL_TTL,
+                version,
+                body,
+            )
+            self.local.move_to_end(key)
+            while len(self.local) > settings.REFERENCE_CACHE_LOCAL_SIZE:
+                self.local.popitem(last=False)
+
+    def invalidate(self):
+        table_versions.bump(self.prefix)
+        with self.lock:
+            self.local.clear()
+
+
+class CachedReadMixin:
+    """Serve list/retrieve from ``reference_cache`` as pre-rendered JSON."""
+
+    reference_cache = None
+
+    def cached_response(self, request, handler, *args, **kwargs):
+        if request.accepted_renderer.format != 'json':
+            return handler(request, *args, **kwargs)
+        key = request.get_full_path()
+        # The version ConditionalGetMixin built the ETag from, if any:
+        # the body then matches its validator without another lookup.
+        version = getattr(request, 'table_versions', {}).get(
+            self.reference_cache.prefix
+        )
+        body = self.reference_cache.get(key, version)
+        if body is None:
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            body = JSONRenderer().render(response.data)
+            self.reference_cache.set(key, body, version)
+        return HttpResponse(body, content_type='application/json')
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, super().retrieve, *args, **kwargs
+        )
+
+
+class TagSlugMap:
+    """Per-worker slug -> id map, reloaded when the tags version moves."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.slugs = {}
+
+    def get(self):
+        version = table_versions.get('tags')
+        with self.lock:
+            if version != self.version:
+                self.slugs = dict(Tag.objects.values_list('slug', 'id'))
+                self.version = version
+            return self.slugs
+
+
+tag_cache = ReferenceCache('tags')
+ingredient_cache = ReferenceCache('ingredients')
+tag_slugs = TagSlugMap()
+
+
+class ConditionalGetMixin:
+    """ETag/Last-Modified for list/retrieve from ``table_versions``.
+
+    ``version_tables`` name the tables a response is built from; with
+    ``per_user_versions`` the requesting user's own version is mixed in
+    for representations that carry per-user flags.
+    """
+
+    version_tables = ()
+    per_user_versions = False
+
+    def get_version_tables(self, request):
+        return self.version_tables
+
+    def get_validators(self, request):
+        names = list(self.get_version_tables(request))
+        if self.per_user_versions and request.user.is_authenticated:
+            names.append(f'user:{request.user.pk}')
+        versions = table_versions.get_many(names)
+        request.table_versions = dict(zip(names, versions))
+        etag = quote_etag(hashlib.md5(repr((
+            request.get_full_path(),
+            request.user.pk,
+            request.accepted_media_type,
+            versions,
+        )).encode()).hexdigest())
+        return etag, int(max(versions))
+
+    def conditional_response(self, request, handler, *args, **kwargs):
+        etag, last_modified = self.get_validators(request)
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if response.status_code in (
+            status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED
+        ):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            if self.per_user_versions:
+                patch_vary_headers(response, ('Authorization',))
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, super().list, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            request, super().retrieve, *args, **kwargs
+        )
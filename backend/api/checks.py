@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.core.checks import Error, Tags, Warning, register
+
+# Backends whose data stays inside one process.
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+# Shared backends whose incr() is a read followed by a write.
+NON_ATOMIC_INCR_CACHES = (
+    'django.core.cache.backends.filebased.FileBasedCache',
+    'django.core.cache.backends.db.DatabaseCache',
+)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """REFERENCE_CACHE_ALIAS must reach every worker. It holds the table
+    versions behind ETags and cache keys, the rendered tag and
+    ingredient bodies, and the pantry index journal (api/pantry.py)."""
+    if settings.SERVER_WORKERS <= 1:
+        return []
+    alias = settings.REFERENCE_CACHE_ALIAS
+    backend = settings.CACHES[alias]['BACKEND']
+    if backend in PROCESS_LOCAL_CACHES:
+        return [Error(
+            f'Кэш {alias!r} ({backend}) виден только своему процессу, а '
+            f'воркеров {settings.SERVER_WORKERS}: версии таблиц, ответы '
+            'тегов и ингредиентов и журнал индекса «Что приготовить» не '
+            'дойдут до остальных воркеров.',
+            hint='Укажите общий кэш в CACHE_BACKEND и CACHE_LOCATION или '
+                 'GUNICORN_WORKERS=1.',
+            id='api.E001',
+        )]
+    if backend in NON_ATOMIC_INCR_CACHES:
+        return [Warning(
+            f'Кэш {alias!r} ({backend}) увеличивает счётчики не атомарно: '
+            'одновременные записи рецептов в разных воркерах могут '
+            'затереть друг друга в журнале индекса «Что приготовить», и '
+            'индекс отстанет до полной пересборки.',
+            hint='Используйте memcached (PyMemcacheCache).',
+            id='api.W002',
+        )]
+    return []
@@ -0,0 +1,146 @@
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers import asgi
+from django.db import close_old_connections, connections
+from rest_framework.permissions import SAFE_METHODS
+
+from .middleware import record_queries
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.ASGI_THREADS,
+            thread_name_prefix='foodgram-read'
+        )
+    return _executor
+
+
+def run_view(view, request, *args, **kwargs):
+    """Run a sync view to completion in the calling thread.
+
+    Worker threads see no request_started/request_finished signals, so
+    connections are recycled here, and the response is rendered before
+    the event loop gets it. Streaming content stays lazy; ASGIHandler
+    pulls it off the loop.
+    """
+    close_old_connections()
+    try:
+        with record_queries(getattr(request, 'query_recorder', None)):
+            response = view(request, *args, **kwargs)
+            if hasattr(response, 'render'):
+                response.render()
+        return response
+    finally:
+        close_old_connections()
+
+
+def read_concurrently(view):
+    """Make ``view`` async when the project is served over ASGI.
+
+    Safe methods run in the shared thread pool, so slow reads overlap;
+    writes keep Django's default single thread-sensitive executor.
+    Under WSGI the view is returned unchanged.
+    """
+    if settings.SERVER_MODE != 'asgi':
+        return view
+    run = functools.partial(run_view, view)
+    read = sync_to_async(
+        run, thread_sensitive=False, executor=get_executor()
+    )
+    write = sync_to_async(run, thread_sensitive=True)
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method in SAFE_METHODS:
+            return await read(request, *args, **kwargs)
+        return await write(request, *args, **kwargs)
+
+    return wrapper
+
+
+def concurrent_urls(patterns):
+    """Apply ``read_concurrently`` to every view in ``patterns``."""
+    for pattern in patterns:
+        pattern.callback = read_concurrently(pattern.callback)
+    return patterns
+
+
+def read_block(parts, size):
+    """Join parts of a streaming response up to ``size`` bytes; b'' once
+    it is exhausted."""
+    block = []
+    length = 0
+    for part in parts:
+        block.append(part)
+        length += len(part)
+        if length >= size:
+            break
+    return b''.join(block)
+
+
+def close_connections():
+    for connection in connections.all():
+        connection.close()
+
+
+class ASGIHandler(asgi.ASGIHandler):
+    """Send streaming responses chunk by chunk without blocking the loop.
+
+    Django 3.2 iterates streaming content synchronously inside the event
+    loop, where the ORM refuses to run, and cannot consume async
+    iterators. Here the content is pulled in blocks of ``chunk_size``
+    through ``sync_to_async``, on one thread for the whole stream, so
+    lazy querysets such as the shopping list export keep their cursor
+    and memory stays flat.
+    """
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+        headers = [
+            (
+                header.encode('ascii') if isinstance(header, str) else header,
+                value.encode('latin1') if isinstance(value, str) else value,
+            )
+            for header, value in response.items()
+        ]
+        headers.extend(
+            (b'Set-Cookie', cookie.output(header='').encode('ascii').strip())
+            for cookie in response.cookies.values()
+        )
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': headers,
+        })
+        executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='foodgram-stream'
+        )
+        in_stream_thread = functools.partial(
+            sync_to_async, thread_sensitive=False, executor=executor
+        )
+        parts = iter(response)
+        try:
+            while True:
+                block = await in_stream_thread(read_block)(
+                    parts, self.chunk_size
+                )
+                if not block:
+                    break
+                await send({
+                    'type': 'http.response.body',
+                    'body': block,
+                    'more_body': True,
+                })
+            await send({'type': 'http.response.body'})
+        finally:
+            await in_stream_thread(response.close)()
+            await in_stream_thread(close_connections)()
+            executor.shutdown(wait=False)
@@ -0,0 +1,69 @@
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce, Greatest
+
+from recipes.models import Favorite, Recipe, ShoppingList
+from users.models import Follow, User
+
+from .versions import table_versions
+
+# (model, counter field, source model, source FK to model)
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'shopping_cart_count', ShoppingList, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Follow, 'author'),
+)
+# Tables whose ordering depends on the counters.
+COUNTER_VERSIONS = ('popularity', 'users')
+
+
+def adjust(model, pk, field, delta):
+    """Shift a denormalized counter in one UPDATE, never below zero."""
+    adjust_many(model, [pk], field, delta)
+
+
+def adjust_many(model, pks, field, delta):
+    model.objects.filter(pk__in=pks).update(
+        **{field: Greatest(F(field) + delta, 0)}
+    )
+    if model is Recipe and field == 'favorites_count':
+        table_versions.bump('popularity')
+
+
+def live_count(source, foreign_key):
+    return Coalesce(
+        Subquery(
+            source.objects
+            .filter(**{foreign_key: OuterRef('pk')})
+            .order_by()
+            .values(foreign_key)
+            .annotate(total=Count('pk'))
+            .values('total')
+        ),
+        0
+    )
+
+
+def rebuild():
+    """Recount every counter from its source table.
+
+    Returns the number of rows that had drifted, per counter.
+    """
+    drifted = verify()
+    for model, field, source, foreign_key in COUNTERS:
+        model.objects.update(**{field: live_count(source, foreign_key)})
+    table_versions.bump(*COUNTER_VERSIONS)
+    return drifted
+
+
+def verify():
+    """Return the number of rows whose counter drifted, per counter."""
+    return {
+        f'{model._meta.label}.{field}': (
+            model.objects
+            .annotate(live=live_count(source, foreign_key))
+            .exclude(**{field: F('live')})
+            .count()
+        )
+        for model, field, source, foreign_key in COUNTERS
+    }
@@ -0,0 +1,116 @@
+import base64
+import binascii
+import io
+import os
+import re
+import tempfile
+import uuid
+import weakref
+
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile, UploadedFile
+from PIL import Image
+from rest_framework import serializers
+from rest_framework.fields import SkipField
+
+DATA_URI = re.compile(r'^data:(?P<type>image/[\w.+-]+);base64,')
+
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class DecodedImageFile(TemporaryUploadedFile):
+    """Temporary upload that storage may move away without GC errors."""
+
+    def __init__(self, name, content_type):
+        file = tempfile.NamedTemporaryFile(
+            suffix='.upload' + os.path.splitext(name)[1],
+            dir=settings.FILE_UPLOAD_TEMP_DIR,
+            delete=False
+        )
+        UploadedFile.__init__(self, file, name, content_type, 0, None)
+        weakref.finalize(self, remove_file, file.name)
+
+
+class Base64ImageField(serializers.ImageField):
+    """Image from a ``data:image/...;base64,`` URI, decoded to a temp file.
+
+    The payload is decoded in chunks straight into a
+    TemporaryUploadedFile, so storage can move it into place. Byte and
+    pixel limits are checked before the whole image is decoded.
+    """
+
+    default_error_messages = {
+        'invalid_base64': 'Некорректные данные изображения.',
+        'too_large': 'Размер изображения превышает {max_size} байт.',
+        'too_many_pixels': (
+            'Изображение больше {max_pixels} пикселей.'
+        ),
+    }
+    # Multiple of 4 so each slice decodes on its own.
+    chunk_size = 64 * 1024
+
+    def to_internal_value(self, data):
+        if isinstance(data, str):
+            if data.startswith('http'):
+                raise SkipField()
+            match = DATA_URI.match(data)
+            if match:
+                data = self.decode(data, match)
+        return super().to_internal_value(data)
+
+    def decode(self, data, match):
+        max_size = settings.IMAGE_UPLOAD_MAX_SIZE
+        start = match.end()
+        if (len(data) - start) // 4 * 3 > max_size + 2:
+            self.fail('too_large', max_size=max_size)
+        content_type = match.group('type')
+        extension = content_type.split('/')[-1].split('+')[0]
+        file = DecodedImageFile(f'{uuid.uuid4()}.{extension}', content_type)
+        try:
+            for offset in range(start, len(data), self.chunk_size):
+                chunk = base64.b64decode(
+                    data[offset:offset + self.chunk_size], validate=True
+                )
+                if offset == start:
+                    self.check_pixels(chunk)
+                file.write(chunk)
+        except (binascii.Error, ValueError):
+            file.close()
+            self.fail('invalid_base64')
+        except serializers.ValidationError:
+            file.close()
+            raise
+        file.size = file.tell()
+        if file.size > max_size:
+            file.close()
+            self.fail('too_large', max_size=max_size)
+        self.check_pixels(file)
+        file.seek(0)
+        return file
+
+    def check_pixels(self, source):
+        """Reject oversized images from their header alone."""
+        if isinstance(source, bytes):
+            source = io.BytesIO(source)
+        source.seek(0)
+        try:
+            width, height = Image.open(source).size
+        except Image.DecompressionBombError:
+            self.fail(
+                'too_many_pixels',
+                max_pixels=settings.IMAGE_UPLOAD_MAX_PIXELS
+            )
+        except Exception:
+            # Header not complete yet, or not an image; the full file is
+            # checked again and ImageField validates the format.
+            return
+        finally:
+            source.seek(0, io.SEEK_END)
+        max_pixels = settings.IMAGE_UPLOAD_MAX_PIXELS
+        if width * height > max_pixels:
+            self.fail('too_many_pixels', max_pixels=max_pixels)
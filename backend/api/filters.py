@@ -1,35 +1,77 @@
+from django.conf import settings
+from django.db.models import Exists, OuterRef
 from django_filters import rest_framework as filters
-from rest_framework.filters import SearchFilter
+from rest_framework.filters import BaseFilterBackend
 
-from recipes.models import Recipe, Tag
+from recipes.models import Favorite, Recipe, ShoppingList
 
+from .cache import tag_slugs
+from .search import search_ingredients, search_recipes
 
-class IngredientFilter(SearchFilter):
+
+class IngredientFilter(BaseFilterBackend):
     search_param = 'name'
 
+    def filter_queryset(self, request, queryset, view):
+        query = request.query_params.get(self.search_param, '').strip()
+        if not query:
+            return queryset
+        return search_ingredients(
+            queryset, query, settings.INGREDIENT_SEARCH_LIMIT
+        )
+
+
+def tag_choices():
+    return [(slug, slug) for slug in tag_slugs.get()]
+
 
 class RecipeFilter(filters.FilterSet):
-    author = filters.CharFilter()
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        queryset=Tag.objects.all(),
+    author = filters.NumberFilter(field_name='author')
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_choices,
         label='Tags',
-        to_field_name='slug'
+        method='get_tags'
     )
     is_favorited = filters.BooleanFilter(method='get_favorite')
     is_in_shopping_cart = filters.BooleanFilter(
         method='get_is_in_shopping_cart')
+    search = filters.CharFilter(method='get_search')
 
     class Meta:
         model = Recipe
-        fields = ['tags', 'author', 'is_favorited', 'is_in_shopping_cart']
+        fields = ['tags', 'author', 'is_favorited', 'is_in_shopping_cart',
+                  'search']
+
+    def get_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        slugs = tag_slugs.get()
+        return queryset.filter(Exists(
+            Recipe.tags.through.objects.filter(
+                recipe=OuterRef('pk'),
+                tag_id__in=[slugs[slug] for slug in value]
+            )
+        ))
+
+    def filter_by_user(self, queryset, model, value):
+        if not value:
+            return queryset
+        if not self.request.user.is_authenticated:
+            return queryset.none()
+        return queryset.filter(Exists(
+            model.objects.filter(
+                user=self.request.user, recipe=OuterRef('pk')
+            )
+        ))
 
     def get_favorite(self, queryset, name, value):
-        if value:
-            return queryset.filter(favorites__user=self.request.user)
-        return queryset
+        return self.filter_by_user(queryset, Favorite, value)
 
     def get_is_in_shopping_cart(self, queryset, name, value):
-        if value:
-            return queryset.filter(shopping_cart__user=self.request.user)
-        return queryset
+        return self.filter_by_user(queryset, ShoppingList, value)
+
+    def get_search(self, queryset, name, value):
+        value = value.strip()
+        if not value:
+            return queryset
+        return search_recipes(queryset, value)
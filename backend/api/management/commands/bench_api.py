@@ -0,0 +1,350 @@
+import json
+import random
+import statistics
+import subprocess
+import time
+from urllib.parse import urlencode
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api import activity, counters
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingList, ShoppingListTotal, Tag)
+from users.models import Follow, User
+
+BENCH_PREFIX = 'bench'
+SEARCH_TERMS = ('а', 'со', 'мук', 'сыр', 'молоко', 'ябл', 'пер', 'кур')
+RECIPE_WORDS = (
+    'курица', 'сыр', 'томаты', 'чеснок', 'молоко', 'яблоки', 'перец',
+    'мука', 'грибы', 'картофель', 'лук', 'морковь', 'рис', 'гречка',
+    'творог', 'сливки', 'укроп', 'базилик', 'лосось', 'говядина',
+)
+
+
+class Rollback(Exception):
+    pass
+
+
+def seed(options):
+    """Bulk-insert synthetic data; returns the benchmark user."""
+    rng = random.Random(options['seed'])
+    User.objects.bulk_create(
+        User(
+            username=f'{BENCH_PREFIX}_user_{index}',
+            email=f'{BENCH_PREFIX}_{index}@example.com',
+            first_name='Бенч',
+            last_name='Марк',
+        )
+        for index in range(options['users'])
+    )
+    users = list(User.objects.filter(username__startswith=BENCH_PREFIX))
+    Ingredient.objects.bulk_create(
+        Ingredient(
+            name=f'{rng.choice(SEARCH_TERMS)}{BENCH_PREFIX}{index}',
+            measurement_unit='г'
+        )
+        for index in range(options['ingredients'])
+    )
+    ingredients = list(
+        Ingredient.objects.values_list('id', flat=True)
+    )
+    tags = list(Tag.objects.all())
+    for index in range(len(tags), 3):
+        tags.append(Tag.objects.create(
+            name=f'{BENCH_PREFIX}_tag_{index}',
+            color=f'#{index:06d}',
+            slug=f'{BENCH_PREFIX}_tag_{index}'
+        ))
+    now = timezone.now()
+    Recipe.objects.bulk_create(
+        (
+            Recipe(
+                name=f'{BENCH_PREFIX} recipe {index}',
+                author=rng.choice(users),
+                text='Синтетический рецепт: {}.'.format(
+                    ', '.join(rng.sample(RECIPE_WORDS, 3))
+                ),
+                cooking_time=rng.randint(1, 120),
+                image='recipe_images/bench.png',
+                pub_date=now - timezone.timedelta(minutes=index),
+            )
+            for index in range(options['recipes'])
+        ),
+        batch_size=1000
+    )
+    recipes = list(
+        Recipe.objects.filter(name__startswith=BENCH_PREFIX)
+        .values_list('id', flat=True)
+    )
+    Recipe.tags.through.objects.bulk_create(
+        (
+            Recipe.tags.through(recipe_id=recipe_id, tag_id=tag.id)
+            for recipe_id in recipes
+            for tag in rng.sample(tags, 2)
+        ),
+        batch_size=5000
+    )
+    RecipeIngredient.objects.bulk_create(
+        (
+            RecipeIngredient(
+                recipe_id=recipe_id,
+                ingredient_id=ingredient_id,
+                amount=rng.randint(1, 500)
+            )
+            for recipe_id in recipes
+            for ingredient_id in rng.sample(
+                ingredients, min(options['recipe_ingredients'],
+                                 len(ingredients))
+            )
+        ),
+        batch_size=5000
+    )
+    for model, per_user in (
+        (Favorite, options['favorites']),
+        (ShoppingList, options['carts']),
+    ):
+        model.objects.bulk_create(
+            (
+                model(user=user, recipe_id=recipe_id)
+                for user in users
+                for recipe_id in rng.sample(
+                    recipes, min(per_user, len(recipes))
+                )
+            ),
+            batch_size=5000,
+            ignore_conflicts=True
+        )
+    Follow.objects.bulk_create(
+        (
+            Follow(user=user, author=author)
+            for user in users
+            for author in rng.sample(users, min(options['follows'],
+                                                len(users)))
+            if author != user
+        ),
+        batch_size=5000,
+        ignore_conflicts=True
+    )
+    ShoppingListTotal.objects.bulk_create(
+        (
+            ShoppingListTotal(
+                user_id=user_id, ingredient_id=ingredient_id, amount=total
+            )
+            for user_id, ingredient_id, total in (
+                ShoppingListTotal.objects.live_totals().iterator()
+            )
+        ),
+        batch_size=5000,
+        ignore_conflicts=True
+    )
+    Recipe.objects.filter(pk__in=recipes).update_search_vectors()
+    counters.rebuild()
+    activity.rebuild()
+    return users[0]
+
+
+def scenarios(user, tag):
+    recipe_ids = list(
+        Recipe.objects.filter(name__startswith=BENCH_PREFIX)
+        .order_by('?').values_list('id', flat=True)[:50]
+    )
+    ingredient_ids = list(
+        Ingredient.objects.order_by('?').values_list('id', flat=True)[:100]
+    )
+    return {
+        'recipes_list': lambda i: '/api/recipes/?page_size=6',
+        'recipes_list_deep': lambda i: '/api/recipes/?page=50&page_size=6',
+        'recipes_list_cursor': (
+            lambda i: '/api/recipes/?pagination=cursor&page_size=6'
+        ),
+        'recipes_list_popular': (
+            lambda i: '/api/recipes/?ordering=popular&page_size=6'
+        ),
+        'recipes_retrieve': (
+            lambda i: f'/api/recipes/{recipe_ids[i % len(recipe_ids)]}/'
+        ),
+        'recipes_filter_tags': lambda i: f'/api/recipes/?tags={tag.slug}',
+        'recipes_filter_author': lambda i: f'/api/recipes/?author={user.id}',
+        'recipes_filter_favorited': lambda i: '/api/recipes/?is_favorited=1',
+        'recipes_filter_cart': (
+            lambda i: '/api/recipes/?is_in_shopping_cart=1'
+        ),
+        'recipes_search': (
+            lambda i: '/api/recipes/?search={}&page_size=6'.format(
+                RECIPE_WORDS[i % len(RECIPE_WORDS)]
+            )
+        ),
+        'recipes_cookable': lambda i: '/api/recipes/cookable/?{}'.format(
+            urlencode([
+                ('ingredients', pk)
+                for pk in ingredient_ids[i % 10 * 10:i % 10 * 10 + 10]
+            ])
+        ),
+        'ingredients_search': (
+            lambda i: '/api/ingredients/?name={}{}'.format(
+                SEARCH_TERMS[i % len(SEARCH_TERMS)], i
+            )
+        ),
+        'recipes_feed': lambda i: '/api/recipes/feed/?page_size=6',
+        'subscriptions': (
+            lambda i: '/api/users/subscriptions/?recipes_limit=3'
+        ),
+        'download_shopping_cart': (
+            lambda i: '/api/recipes/download_shopping_cart/'
+        ),
+    }
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def measure(client, make_url, iterations, warmup):
+    connection = connections[DEFAULT_DB_ALIAS]
+    for index in range(warmup):
+        consume(client.get(make_url(index)))
+    latencies = []
+    queries = []
+    started = time.perf_counter()
+    for index in range(iterations):
+        with CaptureQueriesContext(connection) as context:
+            request_started = time.perf_counter()
+            response = client.get(make_url(index))
+            consume(response)
+            latencies.append(time.perf_counter() - request_started)
+        if response.status_code != 200:
+            raise CommandError(
+                f'{make_url(index)} вернул {response.status_code}'
+            )
+        queries.append(len(context.captured_queries))
+    elapsed = time.perf_counter() - started
+    return {
+        'iterations': iterations,
+        'throughput_rps': round(iterations / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 3),
+        'queries': max(queries),
+    }
+
+
+def consume(response):
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        'Наполняет базу синтетическими данными и замеряет горячие '
+        'эндпоинты API. Данные откатываются после прогона.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--recipes', type=int, default=2000)
+        parser.add_argument('--ingredients', type=int, default=500)
+        parser.add_argument('--recipe-ingredients', type=int, default=8)
+        parser.add_argument('--favorites', type=int, default=30)
+        parser.add_argument('--carts', type=int, default=10)
+        parser.add_argument('--follows', type=int, default=10)
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument(
+            '--only', nargs='*', help='Запустить только эти сценарии.'
+        )
+        parser.add_argument('--output', help='Куда записать JSON.')
+        parser.add_argument(
+            '--compare', help='JSON предыдущего прогона для сравнения.'
+        )
+        parser.add_argument(
+            '--keep', action='store_true',
+            help='Не откатывать сгенерированные данные.'
+        )
+
+    def handle(self, *args, **options):
+        report = {}
+        try:
+            with transaction.atomic():
+                report = self.run(options)
+                if not options['keep']:
+                    raise Rollback
+        except Rollback:
+            pass
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(text)
+        else:
+            self.stdout.write(text)
+        if options['compare']:
+            self.compare(options['compare'], report)
+
+    def run(self, options):
+        seed_started = time.perf_counter()
+        user = seed(options)
+        seed_time = time.perf_counter() - seed_started
+        client = APIClient()
+        token, _ = Token.objects.get_or_create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        tag = Tag.objects.first()
+        results = {}
+        for name, make_url in scenarios(user, tag).items():
+            if options['only'] and name not in options['only']:
+                continue
+            results[name] = measure(
+                client, make_url, options['iterations'], options['warmup']
+            )
+            self.stderr.write(f'{name}: {results[name]}')
+        return {
+            'meta': {
+                'revision': git_revision(),
+                'vendor': connections[DEFAULT_DB_ALIAS].vendor,
+                'timestamp': timezone.now().isoformat(),
+                'seed_seconds': round(seed_time, 3),
+                'volumes': {
+                    key: options[key] for key in (
+                        'users', 'recipes', 'ingredients',
+                        'recipe_ingredients', 'favorites', 'carts',
+                        'follows',
+                    )
+                },
+            },
+            'results': results,
+        }
+
+    def compare(self, path, report):
+        with open(path, encoding='utf-8') as file:
+            baseline = json.load(file)['results']
+        for name, current in report.get('results', {}).items():
+            previous = baseline.get(name)
+            if previous is None:
+                continue
+            change = (
+                (current['p50_ms'] - previous['p50_ms'])
+                / previous['p50_ms'] * 100
+                if previous['p50_ms'] else 0
+            )
+            self.stdout.write(
+                f'{name}: p50 {previous["p50_ms"]} -> {current["p50_ms"]} '
+                f'мс ({change:+.1f}%), запросов {previous["queries"]} -> '
+                f'{current["queries"]}'
+            )
@@ -0,0 +1,248 @@
+import argparse
+import asyncio
+import io
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from api.concurrency import ASGIHandler
+
+from .bench_api import git_revision, percentile
+
+MODES = ('wsgi', 'asgi')
+
+
+def slow_io(delay):
+    """Execute wrapper that adds ``delay`` seconds to every query."""
+    def wrapper(execute, sql, params, many, context):
+        time.sleep(delay)
+        return execute(sql, params, many, context)
+    return wrapper
+
+
+def install_slow_io(delay):
+    def on_connection_created(sender, connection, **kwargs):
+        # Connections open lazily, inside execute_wrapper() blocks that
+        # pop the last wrapper on exit; the delay goes underneath them.
+        connection.execute_wrappers.insert(0, slow_io(delay))
+    connection_created.connect(on_connection_created, weak=False)
+    connections.close_all()
+
+
+def wsgi_environ(path):
+    path, _, query = path.partition('?')
+    return {
+        'REQUEST_METHOD': 'GET',
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'SCRIPT_NAME': '',
+        'SERVER_NAME': 'localhost',
+        'SERVER_PORT': '80',
+        'SERVER_PROTOCOL': 'HTTP/1.1',
+        'HTTP_HOST': 'localhost',
+        'wsgi.input': io.BytesIO(),
+        'wsgi.errors': sys.stderr,
+        'wsgi.url_scheme': 'http',
+        'wsgi.version': (1, 0),
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+
+
+def asgi_scope(path):
+    path, _, query = path.partition('?')
+    return {
+        'type': 'http',
+        'asgi': {'version': '3.0'},
+        'http_version': '1.1',
+        'method': 'GET',
+        'scheme': 'http',
+        'path': path,
+        'raw_path': path.encode(),
+        'query_string': query.encode(),
+        'root_path': '',
+        'headers': [(b'host', b'localhost')],
+        'client': ('127.0.0.1', 0),
+        'server': ('localhost', 80),
+    }
+
+
+def run_wsgi(path, requests, concurrency, workers):
+    """Closed-loop clients against ``workers`` synchronous worker slots,
+    like gunicorn's sync workers: extra clients wait in the queue."""
+    application = get_wsgi_application()
+    slots = threading.Semaphore(workers)
+
+    def request(_):
+        statuses = []
+        started = time.perf_counter()
+        with slots:
+            body = application(
+                wsgi_environ(path),
+                lambda status, headers, *args: statuses.append(status)
+            )
+            try:
+                for _ in body:
+                    pass
+            finally:
+                body.close()
+        return time.perf_counter() - started, int(statuses[0][:3])
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        return list(pool.map(request, range(requests)))
+
+
+def run_asgi(path, requests, concurrency):
+    """Closed-loop clients against one event loop, like a uvicorn
+    worker."""
+    application = ASGIHandler()
+
+    async def request():
+        statuses = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(message):
+            if message['type'] == 'http.response.start':
+                statuses.append(message['status'])
+
+        started = time.perf_counter()
+        await application(asgi_scope(path), receive, send)
+        return time.perf_counter() - started, statuses[0]
+
+    async def client(queue, results):
+        while queue:
+            queue.pop()
+            results.append(await request())
+
+    async def main():
+        queue = list(range(requests))
+        results = []
+        await asyncio.gather(
+            *(client(queue, results) for _ in range(concurrency))
+        )
+        return results
+
+    return asyncio.run(main())
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает пропускную способность WSGI и ASGI при медленном '
+        'вводе-выводе: к каждому SQL-запросу добавляется задержка.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path', default='/api/recipes/',
+            help='Адрес, который запрашивают клиенты.'
+        )
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument(
+            '--concurrency', type=int, default=20,
+            help='Число одновременных клиентов.'
+        )
+        parser.add_argument(
+            '--delay', type=float, default=20,
+            help='Задержка каждого SQL-запроса, мс.'
+        )
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help='Синхронных воркеров в режиме WSGI.'
+        )
+        parser.add_argument(
+            '--only', nargs='*', choices=MODES,
+            help='Запустить только эти режимы.'
+        )
+        parser.add_argument('--output', help='Куда записать JSON.')
+        parser.add_argument('--run', choices=MODES, help=argparse.SUPPRESS)
+
+    def handle(self, *args, **options):
+        if options['run']:
+            return self.run_mode(options)
+        results = {}
+        for mode in MODES:
+            if options['only'] and mode not in options['only']:
+                continue
+            results[mode] = self.spawn(mode, options)
+            self.stderr.write(f'{mode}: {results[mode]}')
+        report = {
+            'meta': {
+                'revision': git_revision(),
+                'path': options['path'],
+                'requests': options['requests'],
+                'concurrency': options['concurrency'],
+                'delay_ms': options['delay'],
+                'wsgi_workers': options['workers'],
+                'asgi_threads': settings.ASGI_THREADS,
+            },
+            'results': results,
+        }
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(text)
+        else:
+            self.stdout.write(text)
+
+    def spawn(self, mode, options):
+        """Each mode needs its own process: SERVER_MODE is read once,
+        when the URLconf is built."""
+        process = subprocess.run(
+            [
+                sys.executable, str(settings.BASE_DIR / 'manage.py'),
+                'bench_concurrency', '--run', mode,
+                '--path', options['path'],
+                '--requests', str(options['requests']),
+                '--concurrency', str(options['concurrency']),
+                '--delay', str(options['delay']),
+                '--workers', str(options['workers']),
+            ],
+            env={**os.environ, 'SERVER_MODE': mode},
+            capture_output=True, text=True,
+        )
+        if process.returncode:
+            raise CommandError(
+                f'Режим {mode} завершился с ошибкой:\n{process.stderr}'
+            )
+        return json.loads(process.stdout)
+
+    def run_mode(self, options):
+        if settings.SERVER_MODE != options['run']:
+            raise CommandError(
+                f'Запустите с SERVER_MODE={options["run"]}.'
+            )
+        install_slow_io(options['delay'] / 1000)
+        started = time.perf_counter()
+        if options['run'] == 'asgi':
+            results = run_asgi(
+                options['path'], options['requests'], options['concurrency']
+            )
+        else:
+            results = run_wsgi(
+                options['path'], options['requests'],
+                options['concurrency'], options['workers']
+            )
+        elapsed = time.perf_counter() - started
+        latencies = [latency for latency, _ in results]
+        errors = sum(status >= 400 for _, status in results)
+        self.stdout.write(json.dumps({
+            'requests_per_second': round(len(results) / elapsed, 1),
+            'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+            'mean_ms': round(statistics.mean(latencies) * 1000, 3),
+            'errors': errors,
+        }))
@@ -0,0 +1,103 @@
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.utils import load_backend
+
+from .bench_api import git_revision, percentile
+
+QUERY = 'SELECT id, name, color, slug FROM recipes_tag ORDER BY name'
+MODES = {
+    'per_request': {'CONN_MAX_AGE': 0, 'POOL_SIZE': 0,
+                    'CONN_HEALTH_CHECKS': False},
+    'persistent': {'CONN_MAX_AGE': 600, 'POOL_SIZE': 0,
+                   'CONN_HEALTH_CHECKS': False},
+    'persistent_health_checks': {'CONN_MAX_AGE': 600, 'POOL_SIZE': 0,
+                                 'CONN_HEALTH_CHECKS': True},
+    'pool': {'CONN_MAX_AGE': 0, 'POOL_SIZE': 4,
+             'CONN_HEALTH_CHECKS': False},
+    'pool_health_checks': {'CONN_MAX_AGE': 0, 'POOL_SIZE': 4,
+                           'CONN_HEALTH_CHECKS': True},
+}
+
+
+def simulate(wrapper, iterations, queries):
+    """Latencies of ``iterations`` request cycles on one connection.
+
+    Mirrors Django's request_started/request_finished handling, which
+    calls close_if_unusable_or_obsolete() on every connection.
+    """
+    latencies = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        wrapper.close_if_unusable_or_obsolete()
+        for _ in range(queries):
+            with wrapper.cursor() as cursor:
+                cursor.execute(QUERY)
+                cursor.fetchall()
+        wrapper.close_if_unusable_or_obsolete()
+        latencies.append(time.perf_counter() - started)
+    wrapper.close()
+    return latencies
+
+
+class Command(BaseCommand):
+    help = (
+        'Сравнивает задержку запросов к БД при подключении на каждый '
+        'запрос, постоянных подключениях и пуле.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--iterations', type=int, default=200)
+        parser.add_argument(
+            '--queries', type=int, default=3,
+            help='SQL-запросов на один HTTP-запрос.'
+        )
+        parser.add_argument(
+            '--only', nargs='*', choices=sorted(MODES),
+            help='Запустить только эти режимы.'
+        )
+        parser.add_argument('--output', help='Куда записать JSON.')
+
+    def handle(self, *args, **options):
+        settings_dict = connections[options['database']].settings_dict
+        if settings_dict['ENGINE'] != 'foodgram.db':
+            raise CommandError(
+                'Нужен бэкенд foodgram.db (PostgreSQL), сейчас '
+                f'{settings_dict["ENGINE"]}.'
+            )
+        backend = load_backend(settings_dict['ENGINE'])
+        results = {}
+        for mode, overrides in MODES.items():
+            if options['only'] and mode not in options['only']:
+                continue
+            wrapper = backend.DatabaseWrapper(
+                {**settings_dict, **overrides}, alias=f'bench_{mode}'
+            )
+            latencies = simulate(
+                wrapper, options['iterations'], options['queries']
+            )
+            results[mode] = {
+                'iterations': options['iterations'],
+                'p50_ms': round(percentile(latencies, 0.5) * 1000, 3),
+                'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+                'mean_ms': round(statistics.mean(latencies) * 1000, 3),
+            }
+            self.stderr.write(f'{mode}: {results[mode]}')
+        report = {
+            'meta': {
+                'revision': git_revision(),
+                'host': settings_dict['HOST'] or 'local socket',
+                'queries_per_request': options['queries'],
+            },
+            'results': results,
+        }
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(text)
+        else:
+            self.stdout.write(text)
@@ -0,0 +1,56 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api import recommendations
+
+STEPS = ('similar', 'recommended')
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает похожие рецепты и рекомендации по избранному и '
+        'спискам покупок. Для нескольких процессов запустите шаг similar '
+        'с --shard 0..N-1 --shards N, дождитесь всех, затем так же шаг '
+        'recommended.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--step', nargs='*', choices=STEPS, default=STEPS,
+            help='Какие шаги выполнить, по умолчанию оба.'
+        )
+        parser.add_argument(
+            '--shard', type=int, default=0,
+            help='Номер этого процесса, от 0.'
+        )
+        parser.add_argument(
+            '--shards', type=int, default=1,
+            help='Сколько процессов делят работу.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int,
+            default=settings.RECOMMENDATIONS_BATCH_SIZE,
+            help='Строк матрицы за один пакет.'
+        )
+
+    def handle(self, *args, **options):
+        shard, shards = options['shard'], options['shards']
+        if not 0 <= shard < shards:
+            raise CommandError('Нужно 0 <= --shard < --shards.')
+        interactions = recommendations.Interactions()
+        if 'similar' in options['step']:
+            stored = recommendations.compute_similar(
+                interactions, settings.RECOMMENDATIONS_NEIGHBORS,
+                options['batch_size'], shard, shards
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f'Похожих рецептов: {stored}'
+            ))
+        if 'recommended' in options['step']:
+            stored = recommendations.compute_recommended(
+                interactions, settings.RECOMMENDATIONS_PER_USER,
+                options['batch_size'], shard, shards
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f'Рекомендаций: {stored}'
+            ))
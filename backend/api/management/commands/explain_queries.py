@@ -0,0 +1,133 @@
+import re
+
+from django.core.exceptions import EmptyResultSet
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import Exists, OuterRef
+
+from api.search import search_recipes
+from recipes.models import Favorite, Recipe, ShoppingList, ShoppingListTotal
+from users.models import Follow, User
+
+# Postgres: "Index Scan using x on t", "Bitmap Index Scan on x";
+# SQLite: "SEARCH t USING [COVERING ]INDEX x (...)".
+INDEX_USED = re.compile(
+    r'(?:Index (?:Only )?Scan (?:Backward )?using|Bitmap Index Scan on|'
+    r'USING (?:COVERING )?INDEX)\s+"?(\w+)"?'
+)
+FULL_SCAN = re.compile(
+    r'Seq Scan on\s+"?(\w+)"?|\bSCAN (?:TABLE )?(\w+)(?!\w| USING)'
+)
+
+
+def explain(queryset):
+    """EXPLAIN output, or None for querysets that never reach the
+    database (``none()``, e.g. a search with no matching terms)."""
+    if queryset.query.is_empty():
+        return None
+    try:
+        return queryset.explain()
+    except (EmptyResultSet, IndexError):
+        # Django 3.2 indexes the first result row of EXPLAIN.
+        return None
+
+
+def hot_queries(user):
+    """Querysets behind the busiest API endpoints."""
+    recipes = Recipe.objects.for_read(user)
+    recipe = Recipe.objects.values('pk', 'author_id').first() or {}
+    return {
+        'recipes_list': recipes.order_by('name')[:6],
+        'recipes_cursor': recipes.order_by('-pub_date', '-id')[:7],
+        'recipes_by_author': recipes.filter(
+            author_id=recipe.get('author_id')
+        ).order_by('name')[:6],
+        'recipes_favorited': recipes.filter(Exists(
+            Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+        )).order_by('name')[:6],
+        'recipes_in_cart': recipes.filter(Exists(
+            ShoppingList.objects.filter(user=user, recipe=OuterRef('pk'))
+        )).order_by('name')[:6],
+        'recipes_search': search_recipes(recipes, 'курица')[:6],
+        'subscriptions': Follow.objects.filter(user=user)[:6],
+        'author_followers': Follow.objects.filter(
+            author_id=recipe.get('author_id')
+        ).values('user_id'),
+        'recipe_favorites': Favorite.objects.filter(
+            recipe_id=recipe.get('pk')
+        ).values('user_id'),
+        'recipe_cart_users': ShoppingList.objects.filter(
+            recipe_id=recipe.get('pk')
+        ).values('user_id'),
+        'shopping_list_totals': ShoppingListTotal.objects.filter(
+            user=user
+        ).values_list(
+            'ingredient__name', 'ingredient__measurement_unit', 'amount'
+        ),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Выводит планы выполнения (EXPLAIN) горячих запросов API и '
+        'используемые индексы.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument(
+            '--username', help='Пользователь для персональных запросов.'
+        )
+        parser.add_argument(
+            '--only', nargs='*', help='Показать только эти запросы.'
+        )
+        parser.add_argument(
+            '--fail-on-full-scan',
+            action='store_true',
+            help='Завершиться с ошибкой, если план содержит полный проход '
+                 'по таблице.'
+        )
+
+    def handle(self, *args, **options):
+        user = self.get_user(options['username'])
+        vendor = connections[options['database']].vendor
+        full_scans = []
+        for name, queryset in hot_queries(user).items():
+            if options['only'] and name not in options['only']:
+                continue
+            plan = explain(queryset.using(options['database']))
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            if plan is None:
+                self.stdout.write('Пустой запрос, в базу не уходит.\n')
+                continue
+            indexes = sorted(set(INDEX_USED.findall(plan)))
+            scans = sorted({
+                table for match in FULL_SCAN.findall(plan)
+                for table in match if table
+            })
+            self.stdout.write(plan)
+            self.stdout.write(
+                'Индексы: {}'.format(', '.join(indexes) or '—')
+            )
+            if scans:
+                full_scans.append(name)
+                self.stdout.write(self.style.WARNING(
+                    'Полный проход: {}'.format(', '.join(scans))
+                ))
+            self.stdout.write('')
+        if full_scans and options['fail_on_full_scan']:
+            raise CommandError(
+                f'Полный проход по таблице ({vendor}): '
+                + ', '.join(full_scans)
+            )
+
+    def get_user(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'Пользователь {username} не найден.')
+        user = User.objects.order_by('pk').first()
+        if user is None:
+            raise CommandError('В базе нет пользователей.')
+        return user
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api import counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает или проверяет счётчики избранного, корзин, '
+        'рецептов и подписчиков.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сравнить счётчики с живой агрегацией.'
+        )
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            drifted = counters.verify()
+            self.write(drifted)
+            if any(drifted.values()):
+                raise CommandError(
+                    'Счётчики расходятся. '
+                    'Запустите команду без --verify для пересчёта.'
+                )
+            self.stdout.write(self.style.SUCCESS('Счётчики совпадают.'))
+            return
+        with transaction.atomic():
+            drifted = counters.rebuild()
+        self.write(drifted)
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны.'))
+
+    def write(self, drifted):
+        for name, rows in drifted.items():
+            self.stdout.write(f'{name}: расхождений {rows}')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api import activity
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересобирает ленты подписок: для каждой подписки на автора без '
+        'массовой аудитории копирует его последние рецепты.'
+    )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            created = activity.rebuild()
+        self.stdout.write(self.style.SUCCESS(
+            f'Записей в лентах: {created}'
+        ))
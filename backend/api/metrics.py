@@ -0,0 +1,79 @@
+import threading
+from bisect import bisect_left
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500)
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name, labels):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(
+                f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}'
+            )
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f'{name}_sum{{{labels}}} {self.sum}')
+        lines.append(f'{name}_count{{{labels}}} {self.count}')
+        return lines
+
+
+class MetricsRegistry:
+    """Per-view request histograms, aggregated in process."""
+
+    metrics = (
+        ('foodgram_request_duration_seconds', LATENCY_BUCKETS,
+         'Время обработки запроса.'),
+        ('foodgram_request_queries', QUERY_COUNT_BUCKETS,
+         'Число SQL-запросов на запрос.'),
+        ('foodgram_request_query_duration_seconds', LATENCY_BUCKETS,
+         'Суммарное время SQL-запросов на запрос.'),
+    )
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def observe(self, view, duration, queries, query_duration):
+        with self.lock:
+            histograms = self.views.get(view)
+            if histograms is None:
+                histograms = self.views[view] = [
+                    Histogram(buckets) for _, buckets, _ in self.metrics
+                ]
+            for histogram, value in zip(
+                histograms, (duration, queries, query_duration)
+            ):
+                histogram.observe(value)
+
+    def render(self):
+        lines = []
+        with self.lock:
+            for index, (name, _, help_text) in enumerate(self.metrics):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for view, histograms in sorted(self.views.items()):
+                    label = view.replace('\\', '\\\\').replace('"', '\\"')
+                    lines.extend(
+                        histograms[index].render(name, f'view="{label}"')
+                    )
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
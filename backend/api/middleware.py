@@ -0,0 +1,85 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.utils.deprecation import MiddlewareMixin
+
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+
+class QueryRecorder:
+
+    def __init__(self):
+        self.statements = []
+        self.duration = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.statements.append(sql)
+
+
+@contextmanager
+def record_queries(recorder):
+    """Feed queries on this thread's connections to ``recorder``."""
+    with ExitStack() as stack:
+        if recorder is not None:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+        yield
+
+
+class MetricsMiddleware(MiddlewareMixin):
+    """Records latency and SQL usage per resolved view name."""
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with record_queries(recorder):
+            response = self.get_response(request)
+        self.observe(request, time.perf_counter() - started, recorder)
+        return response
+
+    async def __acall__(self, request):
+        # Views run in worker threads with their own connections; see
+        # api.concurrency.run_view.
+        request.query_recorder = recorder = QueryRecorder()
+        started = time.perf_counter()
+        response = await self.get_response(request)
+        self.observe(request, time.perf_counter() - started, recorder)
+        return response
+
+    def observe(self, request, duration, recorder):
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        registry.observe(
+            view, duration, len(recorder.statements), recorder.duration
+        )
+        if duration >= settings.SLOW_REQUEST_THRESHOLD:
+            self.log_slow_request(request, view, duration, recorder)
+
+    def log_slow_request(self, request, view, duration, recorder):
+        repeated = Counter(recorder.statements).most_common(
+            settings.SLOW_REQUEST_TOP_QUERIES
+        )
+        logger.warning(
+            'Медленный запрос %s %s (%s): %.3f с, SQL: %d за %.3f с\n%s',
+            request.method,
+            request.path,
+            view,
+            duration,
+            len(recorder.statements),
+            recorder.duration,
+            '\n'.join(f'{count} x {sql}' for sql, count in repeated)
+        )
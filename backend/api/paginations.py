@@ -1,7 +1,146 @@
-from rest_framework.pagination import PageNumberPagination
+from base64 import b64decode, b64encode
+
+from django.core.paginator import Paginator as DjangoPaginator
+from django.db.models import QuerySet
+from django.utils.dateparse import parse_datetime
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (BasePagination, CursorPagination,
+                                       PageNumberPagination, _positive_int)
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class Paginator(DjangoPaginator):
+    """Counts rows without evaluating per-row SELECT annotations."""
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if isinstance(queryset, QuerySet) and queryset.query.annotations:
+            queryset = queryset.model._base_manager.filter(
+                pk__in=queryset.values('pk')
+            )
+            return queryset.count()
+        return super().count
 
 
 class CustomPagination(PageNumberPagination):
+    django_paginator_class = Paginator
+    page_size = 6
+    page_size_query_param = 'page_size'
+    max_page_size = 60
+
+
+class CustomCursorPagination(CursorPagination):
+    page_size = 6
+    page_size_query_param = 'page_size'
+    max_page_size = 60
+    ordering = ('-pub_date', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        return getattr(view, 'cursor_ordering', self.ordering)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': None,
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            'results': data,
+        })
+
+
+class FeedPagination(BasePagination):
+    """Page numbers by default, keyset cursors with ?pagination=cursor."""
+
+    mode_query_param = 'pagination'
+
+    def __init__(self):
+        self.paginator = None
+
+    def is_cursor_mode(self, request):
+        return (
+            request.query_params.get(self.mode_query_param) == 'cursor'
+            or CustomCursorPagination.cursor_query_param
+            in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        if self.is_cursor_mode(request):
+            self.paginator = CustomCursorPagination()
+        else:
+            self.paginator = CustomPagination()
+        return self.paginator.paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        return self.paginator.get_paginated_response(data)
+
+
+class KeysetPagination(BasePagination):
+    """Opaque (pub_date, id) cursors over keys a view computes itself.
+
+    ``paginate_keys`` calls ``fetch(after, size)``, which must return
+    (pub_date, id) keys in descending order strictly after ``after``.
+    """
+
+    cursor_query_param = 'cursor'
     page_size = 6
     page_size_query_param = 'page_size'
     max_page_size = 60
+    invalid_cursor_message = CursorPagination.invalid_cursor_message
+
+    def __init__(self):
+        self.next_key = None
+        self.request = None
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def encode_cursor(self, key):
+        pub_date, pk = key
+        return b64encode(
+            f'{pub_date.isoformat()}|{pk}'.encode()
+        ).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if encoded is None:
+            return None
+        try:
+            pub_date, pk = b64decode(encoded.encode()).decode().split('|')
+            key = parse_datetime(pub_date), int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if key[0] is None:
+            raise NotFound(self.invalid_cursor_message)
+        return key
+
+    def paginate_keys(self, fetch, request):
+        self.request = request
+        size = self.get_page_size(request)
+        keys = fetch(self.decode_cursor(request), size + 1)
+        self.next_key = keys[size - 1] if len(keys) > size else None
+        return keys[:size]
+
+    def get_next_link(self):
+        if self.next_key is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(
+            url, self.cursor_query_param, self.encode_cursor(self.next_key)
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': None,
+            'next': self.get_next_link(),
+            'previous': None,
+            'results': data,
+        })
@@ -0,0 +1,279 @@
+"""Recipes ranked by how many of a user's ingredients they need.
+
+Each worker keeps an inverted index, ingredient id -> array of recipe
+ids, plus every recipe's ingredient ids. It is built once from
+``RecipeIngredient`` and then patched in place from a journal of changed
+recipe ids kept in the shared cache, so a write in one worker reaches
+the others without a full rebuild.
+
+Matching works on bitmaps (Python ints, bit N = recipe N). Per-recipe
+counts are bit-sliced, one bitmap per binary digit, so a query costs a
+few big-int operations per pantry item rather than Python work per
+candidate recipe.
+"""
+import threading
+from array import array
+from collections import OrderedDict
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+from recipes.models import RecipeIngredient
+
+JOURNAL_HEAD_KEY = 'pantry-index:head'
+
+
+def journal_key(position):
+    return f'pantry-index:{position}'
+
+
+def get_cache():
+    return caches[settings.REFERENCE_CACHE_ALIAS]
+
+
+def append_to_journal(recipe_ids):
+    cache = get_cache()
+    cache.add(JOURNAL_HEAD_KEY, 0, None)
+    position = cache.incr(JOURNAL_HEAD_KEY)
+    cache.set(
+        journal_key(position), recipe_ids,
+        settings.PANTRY_INDEX_JOURNAL_TIMEOUT
+    )
+
+
+def recipes_changed(*recipe_ids):
+    """Journal ``recipe_ids`` once the current transaction commits.
+
+    Call after writes that skip RecipeIngredient signals (bulk_create).
+    """
+    transaction.on_commit(partial(append_to_journal, list(recipe_ids)))
+
+
+def to_bitmap(ids):
+    if not ids:
+        return 0
+    buffer = bytearray((max(ids) >> 3) + 1)
+    for value in ids:
+        buffer[value >> 3] |= 1 << (value & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+def popcount(bitmap):
+    return bin(bitmap).count('1')
+
+
+def add_bitmap(counter, bitmap):
+    """Increment the bit-sliced ``counter`` wherever ``bitmap`` is set."""
+    carry = bitmap
+    for digit, plane in enumerate(counter):
+        counter[digit], carry = plane ^ carry, plane & carry
+        if not carry:
+            return
+    counter.append(carry)
+
+
+def subtract(minuend, subtrahend):
+    """Bit-sliced ``minuend - subtrahend``, both non-negative and
+    ``minuend >= subtrahend`` for every recipe."""
+    difference = []
+    borrow = 0
+    for digit in range(max(len(minuend), len(subtrahend))):
+        a = minuend[digit] if digit < len(minuend) else 0
+        b = subtrahend[digit] if digit < len(subtrahend) else 0
+        difference.append(a ^ b ^ borrow)
+        borrow = (~a & (b | borrow)) | (b & borrow)
+    return difference
+
+
+def equal_to(counter, value, universe):
+    """Recipes in ``universe`` whose bit-sliced ``counter`` is ``value``."""
+    if value >> len(counter):
+        return 0
+    for digit, plane in enumerate(counter):
+        universe &= plane if value >> digit & 1 else ~plane
+    return universe
+
+
+class Matches:
+    """Recipe ids by missing ingredients, newest first among equals.
+
+    Sliceable, for paginators.
+    """
+
+    def __init__(self, missing, candidates, max_missing):
+        self.missing = missing
+        self.candidates = candidates
+        self.max_missing = max_missing
+
+    def groups(self):
+        """Non-empty bitmaps of recipes missing 0, 1, 2... ingredients."""
+        remaining = self.candidates
+        count = 0
+        while remaining and (
+            self.max_missing is None or count <= self.max_missing
+        ):
+            group = equal_to(self.missing, count, remaining)
+            if group:
+                yield group
+                remaining &= ~group
+            count += 1
+
+    def __len__(self):
+        return sum(popcount(group) for group in self.groups())
+
+    def __getitem__(self, page):
+        skip = page.start or 0
+        left = None if page.stop is None else page.stop - skip
+        found = []
+        for group in self.groups():
+            if left == 0:
+                break
+            size = popcount(group)
+            if skip >= size:
+                skip -= size
+                continue
+            while group and left != 0:
+                recipe_id = group.bit_length() - 1
+                group ^= 1 << recipe_id
+                if skip:
+                    skip -= 1
+                    continue
+                found.append(recipe_id)
+                if left is not None:
+                    left -= 1
+        return found
+
+
+class IngredientRecipeIndex:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.position = None
+        self.postings = {}
+        self.recipes = {}
+        # Ingredient count of every recipe, bit-sliced.
+        self.sizes = []
+        # Recently queried postings as bitmaps, least recent first.
+        self.bitmaps = OrderedDict()
+
+    def sync(self):
+        """Catch up with the journal; rebuild if entries were lost."""
+        cache = get_cache()
+        cache.add(JOURNAL_HEAD_KEY, 0, None)
+        head = cache.get(JOURNAL_HEAD_KEY)
+        if head == self.position:
+            return
+        changed = None
+        if self.position is not None and 0 < head - self.position <= (
+            settings.PANTRY_INDEX_MAX_REPLAY
+        ):
+            keys = [
+                journal_key(position)
+                for position in range(self.position + 1, head + 1)
+            ]
+            entries = cache.get_many(keys)
+            if len(entries) == len(keys):
+                changed = {
+                    recipe_id
+                    for recipe_ids in entries.values()
+                    for recipe_id in recipe_ids
+                }
+        if changed is None:
+            self.rebuild()
+        else:
+            self.patch(changed)
+        # Changes journaled while we read are replayed next time;
+        # patching is idempotent.
+        self.position = head
+
+    def rebuild(self):
+        postings = {}
+        recipes = {}
+        for recipe_id, ingredient_id in (
+            RecipeIngredient.objects.order_by()
+            .values_list('recipe_id', 'ingredient_id')
+            .iterator(chunk_size=10000)
+        ):
+            if ingredient_id not in postings:
+                postings[ingredient_id] = array('I')
+            postings[ingredient_id].append(recipe_id)
+            recipes.setdefault(recipe_id, []).append(ingredient_id)
+        width = max(map(len, recipes.values()), default=0).bit_length()
+        self.sizes = [
+            to_bitmap([
+                recipe_id for recipe_id, ingredient_ids in recipes.items()
+                if len(ingredient_ids) >> digit & 1
+            ])
+            for digit in range(width)
+        ]
+        self.postings = postings
+        self.recipes = {
+            recipe_id: array('I', ingredient_ids)
+            for recipe_id, ingredient_ids in recipes.items()
+        }
+        self.bitmaps.clear()
+
+    def patch(self, recipe_ids):
+        current = {}
+        for recipe_id, ingredient_id in (
+            RecipeIngredient.objects.filter(recipe_id__in=recipe_ids)
+            .values_list('recipe_id', 'ingredient_id')
+        ):
+            current.setdefault(recipe_id, array('I')).append(ingredient_id)
+        for recipe_id in recipe_ids:
+            old = self.recipes.pop(recipe_id, ())
+            new = current.get(recipe_id, ())
+            for ingredient_id in old:
+                self.postings[ingredient_id].remove(recipe_id)
+                self.bitmaps.pop(ingredient_id, None)
+            for ingredient_id in new:
+                if ingredient_id not in self.postings:
+                    self.postings[ingredient_id] = array('I')
+                self.postings[ingredient_id].append(recipe_id)
+                self.bitmaps.pop(ingredient_id, None)
+            if new:
+                self.recipes[recipe_id] = new
+            self.set_size(recipe_id, len(new))
+
+    def set_size(self, recipe_id, size):
+        bit = 1 << recipe_id
+        while len(self.sizes) < size.bit_length():
+            self.sizes.append(0)
+        for digit, plane in enumerate(self.sizes):
+            if size >> digit & 1:
+                self.sizes[digit] = plane | bit
+            elif plane & bit:
+                self.sizes[digit] = plane & ~bit
+
+    def get_bitmap(self, ingredient_id):
+        bitmap = self.bitmaps.get(ingredient_id)
+        if bitmap is None:
+            bitmap = to_bitmap(self.postings.get(ingredient_id, ()))
+            self.bitmaps[ingredient_id] = bitmap
+            while len(self.bitmaps) > (
+                settings.PANTRY_INDEX_BITMAP_CACHE_SIZE
+            ):
+                self.bitmaps.popitem(last=False)
+        else:
+            self.bitmaps.move_to_end(ingredient_id)
+        return bitmap
+
+    def match(self, ingredient_ids, max_missing=None):
+        """Recipes using any of ``ingredient_ids``: fully makeable first,
+        then by the number of missing ingredients."""
+        with self.lock:
+            self.sync()
+            matched = []
+            candidates = 0
+            for ingredient_id in set(ingredient_ids):
+                bitmap = self.get_bitmap(ingredient_id)
+                add_bitmap(matched, bitmap)
+                candidates |= bitmap
+            # self.sizes is updated in place; read it before releasing.
+            missing = subtract(self.sizes, matched)
+        return Matches(missing, candidates, max_missing)
+
+
+ingredient_recipe_index = IngredientRecipeIndex()
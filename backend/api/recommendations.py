@@ -0,0 +1,200 @@
+"""Item-item recipe similarity from favorites and shopping carts.
+
+Recipes are compared by the users who saved them: cosine similarity of
+the columns of a users x recipes matrix, computed in row batches with
+sparse matrix products. The top neighbours of every recipe go to
+``SimilarRecipe``; a user's recommendations, the neighbours of what
+they saved weighted by similarity, go to ``RecommendedRecipe``.
+
+Work is split into batches of rows; ``shard``/``shards`` pick every
+``shards``-th batch, so several processes can share one run.
+"""
+import csv
+import io
+
+import numpy as np
+from django.conf import settings
+from django.db import connections, router, transaction
+from django.db.models import Exists, OuterRef
+from scipy import sparse
+
+from recipes.models import (Favorite, RecommendedRecipe, ShoppingList,
+                            SimilarRecipe)
+
+
+class Interactions:
+    """Users x recipes matrix of weighted favorites and cart entries."""
+
+    def __init__(self):
+        pairs = []
+        weights = []
+        for model, weight in (
+            (Favorite, settings.RECOMMENDATIONS_FAVORITE_WEIGHT),
+            (ShoppingList, settings.RECOMMENDATIONS_CART_WEIGHT),
+        ):
+            rows = np.array(
+                list(model.objects.values_list('user_id', 'recipe_id')),
+                dtype=np.int64
+            ).reshape(-1, 2)
+            pairs.append(rows)
+            weights.append(np.full(len(rows), weight))
+        pairs = np.concatenate(pairs)
+        self.user_ids, users = np.unique(pairs[:, 0], return_inverse=True)
+        self.recipe_ids, recipes = np.unique(
+            pairs[:, 1], return_inverse=True
+        )
+        # Duplicate (user, recipe) entries, favorite and cart, add up.
+        self.matrix = sparse.csr_matrix(
+            (np.concatenate(weights), (users, recipes)),
+            shape=(len(self.user_ids), len(self.recipe_ids))
+        )
+
+    def normalized_columns(self):
+        norms = np.sqrt(
+            np.asarray(self.matrix.multiply(self.matrix).sum(axis=0))
+        ).ravel()
+        norms[norms == 0] = 1
+        return self.matrix @ sparse.diags(1 / norms)
+
+
+def batches(size, batch_size, shard, shards):
+    for number, start in enumerate(range(0, size, batch_size)):
+        if number % shards == shard:
+            yield start, min(start + batch_size, size)
+
+
+def replace_rows(model, field_names, owner_ids, rows):
+    """Swap the stored rows of ``owner_ids`` for ``rows``.
+
+    ``rows`` are tuples of ``field_names`` values, the first naming the
+    owner. They are written with COPY on PostgreSQL: the ORM spends far
+    longer building millions of instances than the database storing them.
+    """
+    fields = [model._meta.get_field(name) for name in field_names]
+    owner = fields[0].name
+    connection = connections[router.db_for_write(model)]
+    with transaction.atomic(using=connection.alias):
+        model.objects.filter(**{f'{owner}__in': owner_ids}).delete()
+        if connection.vendor != 'postgresql':
+            model.objects.bulk_create(
+                [model(**{
+                    field.attname: value
+                    for field, value in zip(fields, row)
+                }) for row in rows],
+                batch_size=5000
+            )
+            return
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.cursor.copy_expert(
+                'COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(
+                    model._meta.db_table,
+                    ', '.join(field.column for field in fields)
+                ),
+                buffer
+            )
+
+
+def top_k(matrix, row, k, exclude=()):
+    """Column positions and values of the ``k`` largest entries of a CSR
+    ``matrix`` row."""
+    start, end = matrix.indptr[row], matrix.indptr[row + 1]
+    columns, values = matrix.indices[start:end], matrix.data[start:end]
+    keep = values > 0
+    if len(exclude):
+        keep &= ~np.isin(columns, exclude)
+    columns, values = columns[keep], values[keep]
+    if len(values) > k:
+        best = np.argpartition(-values, k - 1)[:k]
+        columns, values = columns[best], values[best]
+    order = np.argsort(-values, kind='stable')
+    return columns[order], values[order]
+
+
+def compute_similar(interactions, neighbors, batch_size, shard=0,
+                    shards=1):
+    """Store the top ``neighbors`` of every recipe in this shard."""
+    normalized = interactions.normalized_columns().tocsc()
+    by_recipe = normalized.T.tocsr()
+    recipe_ids = interactions.recipe_ids
+    stored = 0
+    for start, end in batches(len(recipe_ids), batch_size, shard, shards):
+        scores = (by_recipe[start:end] @ normalized).tocsr()
+        rows = []
+        for offset in range(end - start):
+            columns, values = top_k(
+                scores, offset, neighbors, exclude=[start + offset]
+            )
+            recipe_id = int(recipe_ids[start + offset])
+            rows.extend(zip(
+                [recipe_id] * len(columns),
+                recipe_ids[columns].tolist(),
+                values.tolist()
+            ))
+        replace_rows(
+            SimilarRecipe, ('recipe', 'similar', 'score'),
+            recipe_ids[start:end].tolist(), rows
+        )
+        stored += len(rows)
+    if shard == 0:
+        # Recipes nobody saves any more keep no neighbours.
+        SimilarRecipe.objects.exclude(
+            Exists(Favorite.objects.filter(recipe=OuterRef('recipe')))
+        ).exclude(
+            Exists(ShoppingList.objects.filter(recipe=OuterRef('recipe')))
+        ).delete()
+    return stored
+
+
+def similarity_matrix(interactions):
+    """Stored neighbours as a recipes x recipes matrix."""
+    positions = {
+        recipe_id: position
+        for position, recipe_id in enumerate(interactions.recipe_ids)
+    }
+    rows, columns, values = [], [], []
+    for recipe_id, similar_id, score in SimilarRecipe.objects.values_list(
+        'recipe_id', 'similar_id', 'score'
+    ).iterator(chunk_size=10000):
+        if recipe_id in positions and similar_id in positions:
+            rows.append(positions[recipe_id])
+            columns.append(positions[similar_id])
+            values.append(score)
+    size = len(interactions.recipe_ids)
+    return sparse.csr_matrix((values, (rows, columns)), shape=(size, size))
+
+
+def compute_recommended(interactions, limit, batch_size, shard=0,
+                        shards=1):
+    """Store up to ``limit`` unseen recipes for every user in this shard."""
+    similarity = similarity_matrix(interactions)
+    matrix = interactions.matrix
+    user_ids, recipe_ids = interactions.user_ids, interactions.recipe_ids
+    stored = 0
+    for start, end in batches(len(user_ids), batch_size, shard, shards):
+        seen = matrix[start:end]
+        scores = (seen @ similarity).tocsr()
+        rows = []
+        for offset in range(end - start):
+            saved = seen.indices[seen.indptr[offset]:seen.indptr[offset + 1]]
+            columns, values = top_k(scores, offset, limit, exclude=saved)
+            user_id = int(user_ids[start + offset])
+            rows.extend(zip(
+                [user_id] * len(columns),
+                recipe_ids[columns].tolist(),
+                values.tolist()
+            ))
+        replace_rows(
+            RecommendedRecipe, ('user', 'recipe', 'score'),
+            user_ids[start:end].tolist(), rows
+        )
+        stored += len(rows)
+    if shard == 0:
+        RecommendedRecipe.objects.exclude(
+            Exists(Favorite.objects.filter(user=OuterRef('user')))
+        ).exclude(
+            Exists(ShoppingList.objects.filter(user=OuterRef('user')))
+        ).delete()
+    return stored
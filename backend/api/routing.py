@@ -0,0 +1,54 @@
+import time
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.permissions import SAFE_METHODS
+
+from foodgram.db.routers import pin_primary, reads_from
+
+from .versions import table_versions
+
+
+class ReplicaReadMixin:
+    """Serve safe-method requests from the read replica, if configured.
+
+    Authentication always reads the primary, so fresh tokens work, and
+    users who wrote within ``DATABASE_REPLICA_STICKY_SECONDS`` stay on
+    the primary to read their own writes. Every successful write request
+    counts, and also moves the user's version behind per-user ETags.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        alias = settings.DATABASE_REPLICA_ALIAS
+        if (
+            request.method not in SAFE_METHODS
+            or alias not in settings.DATABASES
+        ):
+            return super().dispatch(request, *args, **kwargs)
+        with reads_from(alias):
+            return super().dispatch(request, *args, **kwargs)
+
+    def perform_authentication(self, request):
+        with reads_from(None):
+            super().perform_authentication(request)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        user = request.user
+        if user.is_authenticated and (
+            time.time() - table_versions.get(f'user:{user.pk}')
+            < settings.DATABASE_REPLICA_STICKY_SECONDS
+        ):
+            pin_primary()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        if (
+            request.method not in SAFE_METHODS
+            and status.is_success(response.status_code)
+            and request.user.is_authenticated
+        ):
+            table_versions.bump(f'user:{request.user.pk}')
+        return response
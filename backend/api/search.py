@@ -0,0 +1,210 @@
+import heapq
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery, SearchRank
+from django.db import connections
+from django.db.models import Case, F, FloatField, IntegerField, Value, When
+from django.db.models.functions import Cast
+
+from recipes.models import Ingredient, Recipe
+
+from .versions import table_versions
+
+WORD = re.compile(r'\w+')
+# Longest first; a rough stand-in for the Snowball stemmer that the
+# 'russian' text search configuration uses.
+RUSSIAN_ENDINGS = sorted((
+    'ами', 'ями', 'ого', 'его', 'ому', 'ему', 'ыми', 'ими', 'ых', 'их',
+    'ой', 'ей', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее', 'ые', 'ие', 'ую',
+    'юю', 'ом', 'ем', 'ах', 'ях', 'ов', 'ев', 'ам', 'ям', 'ть',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь', 'й',
+), key=len, reverse=True)
+# ts_rank's default weights for A (name) and B (text).
+NAME_WEIGHT = 1.0
+TEXT_WEIGHT = 0.4
+
+
+class IngredientPrefixIndex:
+    """Sorted in-process index of ingredient names.
+
+    Serves autocomplete on databases without trigram indexes (SQLite).
+    Prefix matches come from a binary search, substring matches from a
+    scan of the cached names.
+    """
+
+    def __init__(self, ttl):
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.keys = []
+        self.rows = []
+        self.built_at = None
+
+    def invalidate(self):
+        with self.lock:
+            self.built_at = None
+
+    def get_rows(self):
+        with self.lock:
+            if (
+                self.built_at is None
+                or time.monotonic() - self.built_at > self.ttl
+            ):
+                rows = sorted(
+                    (name.lower(), pk)
+                    for pk, name in Ingredient.objects.values_list(
+                        'id', 'name'
+                    )
+                )
+                self.keys = [row[0] for row in rows]
+                self.rows = rows
+                self.built_at = time.monotonic()
+            return self.keys, self.rows
+
+    def search(self, query, limit):
+        query = query.lower()
+        keys, rows = self.get_rows()
+        found = []
+        position = bisect_left(keys, query)
+        while (
+            position < len(keys)
+            and len(found) < limit
+            and keys[position].startswith(query)
+        ):
+            found.append(rows[position])
+            position += 1
+        if len(found) < limit:
+            for row in rows:
+                if query in row[0] and not row[0].startswith(query):
+                    found.append(row)
+                    if len(found) >= limit:
+                        break
+        return [pk for _, pk in found]
+
+
+def tokenize(value):
+    for word in WORD.findall(value.lower().replace('ё', 'е')):
+        for ending in RUSSIAN_ENDINGS:
+            if word.endswith(ending) and len(word) - len(ending) >= 3:
+                word = word[:-len(ending)]
+                break
+        yield word
+
+
+class RecipeSearchIndex:
+    """In-process inverted index of recipe names and texts.
+
+    Serves recipe search on databases without full-text search (SQLite),
+    rebuilt when the recipes version moves.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.postings = {}
+
+    def get_postings(self):
+        version = table_versions.get('recipes')
+        with self.lock:
+            if version != self.version:
+                postings = defaultdict(dict)
+                for pk, name, text in Recipe.objects.values_list(
+                    'id', 'name', 'text'
+                ):
+                    for weight, value in (
+                        (NAME_WEIGHT, name), (TEXT_WEIGHT, text)
+                    ):
+                        for token in tokenize(value):
+                            scores = postings[token]
+                            scores[pk] = scores.get(pk, 0) + weight
+                self.postings = dict(postings)
+                self.version = version
+            return self.postings
+
+    def search(self, query, limit):
+        """Best ``limit`` (id, score) pairs containing every query term."""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        postings = self.get_postings()
+        matches = sorted(
+            (postings.get(term, {}) for term in terms), key=len
+        )
+        scores = dict(matches[0])
+        for other in matches[1:]:
+            scores = {
+                pk: score + other[pk]
+                for pk, score in scores.items() if pk in other
+            }
+        return heapq.nlargest(
+            limit, scores.items(), key=lambda item: (item[1], item[0])
+        )
+
+
+def search_recipes(queryset, query):
+    """Recipes matching ``query``, annotated with ``search_rank``.
+
+    Ordered by relevance, newest first among equals.
+    """
+    if connections[queryset.db].vendor == 'postgresql':
+        search_query = SearchQuery(
+            query, config=settings.RECIPE_SEARCH_CONFIG,
+            search_type='websearch'
+        )
+        # ts_rank() returns real; double precision survives the round
+        # trip through cursor positions.
+        queryset = queryset.filter(search_vector=search_query).annotate(
+            search_rank=Cast(
+                SearchRank(F('search_vector'), search_query), FloatField()
+            )
+        )
+    else:
+        ranked = recipe_index.search(
+            query, settings.RECIPE_SEARCH_FALLBACK_LIMIT
+        )
+        if not ranked:
+            return queryset.none()
+        queryset = queryset.filter(pk__in=[pk for pk, _ in ranked]).annotate(
+            search_rank=Case(
+                *(When(pk=pk, then=Value(score)) for pk, score in ranked),
+                output_field=FloatField()
+            )
+        )
+    return queryset.order_by('-search_rank', '-id')
+
+
+def search_ingredients(queryset, query, limit):
+    """Prefix matches first, then substring matches, at most ``limit``.
+
+    A queryset rather than a list, so detail lookups can filter it.
+    """
+    if connections[queryset.db].vendor == 'postgresql':
+        ids = list(
+            queryset.filter(name__istartswith=query)
+            .order_by('name').values_list('pk', flat=True)[:limit]
+        )
+        if len(ids) < limit:
+            ids += (
+                queryset
+                .filter(name__icontains=query)
+                .exclude(name__istartswith=query)
+                .order_by('name').values_list('pk', flat=True)
+                [:limit - len(ids)]
+            )
+    else:
+        ids = ingredient_index.search(query, limit)
+    if not ids:
+        return queryset.none()
+    return queryset.filter(pk__in=ids).order_by(Case(
+        *(When(pk=pk, then=Value(position))
+          for position, pk in enumerate(ids)),
+        output_field=IntegerField()
+    ))
+
+
+ingredient_index = IngredientPrefixIndex(settings.INGREDIENT_SEARCH_INDEX_TTL)
+recipe_index = RecipeSearchIndex()
@@ -1,18 +1,23 @@
 from django.contrib.auth.password_validation import validate_password
 from django.core import exceptions as django_exceptions
-from django.db import transaction
+from django.db import IntegrityError, transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
-from drf_base64.fields import Base64ImageField
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 
+from recipes import images
 from recipes.models import (Ingredient, Recipe, RecipeIngredient,
-                            ShoppingList, Tag)
+                            ShoppingListTotal, Tag)
 from users.models import User
 from django.conf import settings
 
+from . import activity, counters, pantry
+from .fields import Base64ImageField
+
 MAX_VALUE = settings.MAX_VALUE
 MIN_VALUE = settings.MIN_VALUE
 IMAGE_THUMBNAIL_SIZE = settings.IMAGE_THUMBNAIL_SIZE
+SUBSCRIPTION_RECIPES_LIMIT = settings.SUBSCRIPTION_RECIPES_LIMIT
 
 
 class UserReadSerializer(UserSerializer):
@@ -25,9 +30,11 @@ class UserReadSerializer(UserSerializer):
                   'is_subscribed')
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
         request = self.context.get('request')
         if request and not request.user.is_anonymous:
-            return obj.following.filter(user=request.user).exists()
+            return obj.subscribing.filter(user=request.user).exists()
         return False
 
 
@@ -91,7 +98,7 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
 
 
 class RecipeSerializer(serializers.ModelSerializer):
-    image = Base64ImageField(read_only=True)
+    image = serializers.ImageField(read_only=True)
     name = serializers.ReadOnlyField()
     cooking_time = serializers.ReadOnlyField()
 
@@ -111,21 +118,24 @@ class FollowsSerializer(serializers.ModelSerializer):
                   'is_follow', 'recipes', 'recipes_count')
 
     def get_is_follow(self, obj):
+        if hasattr(obj, 'is_follow'):
+            return obj.is_follow
         request = self.context.get('request')
         return (
             request.user.is_authenticated
-            and obj.followers.filter(user=request.user).exists()
+            and obj.subscribing.filter(user=request.user).exists()
         )
 
     def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_count
 
     def get_recipes(self, obj):
-        request = self.context.get('request')
-        limit = request.GET.get('recipes_limit')
-        recipes = obj.recipes.all()
-        if limit:
-            recipes = recipes[:int(limit)]
+        if hasattr(obj, 'latest_recipes'):
+            recipes = obj.latest_recipes
+        else:
+            request = self.context.get('request')
+            limit = RecipesLimitSerializer.from_request(request)
+            recipes = Recipe.objects.latest_by_author([obj.pk], limit)
         serializer = RecipeSerializer(recipes, many=True, read_only=True)
         return serializer.data
 
@@ -141,6 +151,46 @@ class FollowsSerializer(serializers.ModelSerializer):
         return data
 
 
+class RecipesLimitSerializer(serializers.Serializer):
+    recipes_limit = serializers.IntegerField(
+        min_value=0,
+        max_value=SUBSCRIPTION_RECIPES_LIMIT,
+        default=SUBSCRIPTION_RECIPES_LIMIT
+    )
+
+    @classmethod
+    def from_request(cls, request):
+        serializer = cls(data=request.query_params)
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data['recipes_limit']
+
+
+class RecipeIdsSerializer(serializers.Serializer):
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RECIPE_BATCH_SIZE
+    )
+
+
+class PantrySerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.PANTRY_MAX_INGREDIENTS
+    )
+    max_missing = serializers.IntegerField(min_value=0, required=False)
+
+    @classmethod
+    def from_request(cls, request):
+        serializer = cls(data={
+            **request.query_params.dict(),
+            'ingredients': request.query_params.getlist('ingredients'),
+        })
+        serializer.is_valid(raise_exception=True)
+        return serializer.validated_data
+
+
 class FollowAuthorSerializer(FollowsSerializer):
     recipes = RecipeSerializer(many=True, read_only=True)
 
@@ -168,11 +218,10 @@ class RecipeReadSerializer(serializers.ModelSerializer):
     ingredients = RecipeIngredientSerializer(
         many=True,
         read_only=True,
-        source='recipes'
+        source='recipe_ingredient'
     )
-    is_favorited = serializers.SerializerMethodField()
-    is_in_shopping_cart = serializers.SerializerMethodField()
-    image = Base64ImageField()
+    image = serializers.ImageField(read_only=True)
+    image_sizes = serializers.SerializerMethodField()
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
 
@@ -181,27 +230,58 @@ class RecipeReadSerializer(serializers.ModelSerializer):
         fields = ('id', 'tags', 'author',
                   'ingredients', 'is_favorited',
                   'is_in_shopping_cart', 'name', 'image',
-                  'text', 'cooking_time')
+                  'image_sizes', 'text', 'cooking_time')
+
+    def to_representation(self, instance):
+        if hasattr(instance, 'author_is_subscribed') and instance.author:
+            instance.author.is_subscribed = instance.author_is_subscribed
+        return super().to_representation(instance)
+
+    def get_image_sizes(self, obj):
+        """Rendition URLs by name (settings.IMAGE_RENDITIONS), written by
+        the image pipeline shortly after the recipe is saved."""
+        if not obj.image:
+            return {}
+        request = self.context.get('request')
+        sizes = {}
+        for rendition in settings.IMAGE_RENDITIONS:
+            url = obj.image.storage.url(
+                images.rendition_name(obj.image.name, rendition)
+            )
+            sizes[rendition] = (
+                request.build_absolute_uri(url) if request else url
+            )
+        return sizes
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         if request.user.is_authenticated:
             return obj.favorites.filter(user=request.user).exists()
         return False
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         if request.user.is_authenticated:
-            return obj.shopping_lists.filter(user=request.user).exists()
+            return obj.shopping_cart.filter(user=request.user).exists()
         return False
 
-    def add_to_shopping_cart(self, user, recipe):
-        if not user.shopping_cart.filter(recipe=recipe).exists():
-            ShoppingList.objects.create(user=user, recipe=recipe)
-        else:
-            raise serializers.ValidationError(
-                {'errors': 'Вы уже добавили этот рецепт.'}
-            )
+
+class PantryRecipeSerializer(RecipeReadSerializer):
+    missing_ingredients = serializers.SerializerMethodField()
+
+    class Meta(RecipeReadSerializer.Meta):
+        fields = RecipeReadSerializer.Meta.fields + ('missing_ingredients',)
+
+    def get_missing_ingredients(self, obj):
+        pantry = self.context['pantry']
+        return [
+            row.ingredient_id for row in obj.recipe_ingredient.all()
+            if row.ingredient_id not in pantry
+        ]
 
 
 class RecipeIngredientCreateSerializer(serializers.ModelSerializer):
@@ -255,7 +335,10 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                 raise serializers.ValidationError(
                     f'{field} - Обязательное поле.'
                 )
-        if obj.recipes_with_name.exists():
+        recipes_with_name = Recipe.objects.filter(name=obj['name'])
+        if self.instance is not None:
+            recipes_with_name = recipes_with_name.exclude(pk=self.instance.pk)
+        if recipes_with_name.exists():
             raise serializers.ValidationError(
                 'Рецепт с таким названием уже существует.',
                 code='duplicate_name'
@@ -276,40 +359,109 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
                 'Ингредиенты не должны повторяться.'
             )
 
+        ingredients = Ingredient.objects.in_bulk(unique_ingredient_ids)
+        missing_ids = sorted(unique_ingredient_ids - ingredients.keys())
+        if missing_ids:
+            raise serializers.ValidationError({
+                'ingredients': 'Ингредиенты не найдены: {}.'.format(
+                    ', '.join(map(str, missing_ids))
+                )
+            })
+        for item in obj['ingredients']:
+            item['ingredient'] = ingredients[item['id']]
+
         return obj
 
+    def diff_ingredients(self, recipe, ingredients):
+        current = {
+            row.ingredient_id: row for row in recipe.recipe_ingredient.all()
+        }
+        to_create = []
+        to_update = []
+        for item in ingredients:
+            row = current.pop(item['id'], None)
+            if row is None:
+                to_create.append(RecipeIngredient(
+                    recipe=recipe,
+                    ingredient=item['ingredient'],
+                    amount=item['amount']
+                ))
+            elif row.amount != item['amount']:
+                row.amount = item['amount']
+                to_update.append(row)
+        return to_create, to_update, list(current.values())
+
+    def save(self, **kwargs):
+        # validate() checks the name, but a concurrent save can still take
+        # it first: the constraint then fails here instead of with a 500.
+        try:
+            return super().save(**kwargs)
+        except IntegrityError:
+            recipes_with_name = Recipe.objects.filter(
+                name=self.validated_data['name']
+            )
+            if self.instance is not None:
+                recipes_with_name = recipes_with_name.exclude(
+                    pk=self.instance.pk
+                )
+            if not recipes_with_name.exists():
+                raise
+            raise serializers.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: [
+                    'Рецепт с таким названием уже существует.'
+                ]},
+                code='duplicate_name'
+            )
+
     @transaction.atomic
-    def tags_and_ingredients_set(self, recipe, tags, ingredients):
+    def create(self, validated_data):
+        tags = validated_data.pop('tags')
+        ingredients = validated_data.pop('ingredients')
+        author = self.context['request'].user
+        recipe = Recipe.objects.create(author=author, **validated_data)
+        counters.adjust(User, author.pk, 'recipes_count', 1)
         recipe.tags.set(tags)
         RecipeIngredient.objects.bulk_create(
             [
                 RecipeIngredient(
                     recipe=recipe,
-                    ingredient=Ingredient.objects.get(pk=ingredient['id']),
-                    amount=ingredient['amount']
+                    ingredient=item['ingredient'],
+                    amount=item['amount']
                 )
-                for ingredient in ingredients
+                for item in ingredients
             ]
         )
-
-    @transaction.atomic
-    def create(self, validated_data):
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
-        recipe = Recipe.objects.create(author=self.context['request'].user,
-                                       **validated_data)
-        self.tags_and_ingredients_set(recipe, tags, ingredients)
+        activity.fan_out(recipe)
+        pantry.recipes_changed(recipe.pk)
         return recipe
 
     @transaction.atomic
     def update(self, instance, validated_data):
         tags = validated_data.pop('tags', [])
         ingredients = validated_data.pop('ingredients', [])
-        instance.tags.clear()
-        instance.recipe_ingredient.all().delete()
-        self.tags_and_ingredients_set(instance, tags, ingredients)
+        instance.tags.set(tags)
+        to_create, to_update, to_delete = self.diff_ingredients(
+            instance, ingredients
+        )
+        if to_create or to_update or to_delete:
+            cart_users = list(
+                instance.shopping_cart.values_list('user_id', flat=True)
+            )
+            ShoppingListTotal.objects.apply_recipe(
+                instance, cart_users, sign=-1
+            )
+            RecipeIngredient.objects.bulk_create(to_create)
+            RecipeIngredient.objects.bulk_update(to_update, ['amount'])
+            RecipeIngredient.objects.filter(
+                pk__in=[row.pk for row in to_delete]
+            ).delete()
+            ShoppingListTotal.objects.apply_recipe(instance, cart_users)
+            pantry.recipes_changed(instance.pk)
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
+        instance = Recipe.objects.for_read(
+            self.context['request'].user
+        ).get(pk=instance.pk)
         return RecipeReadSerializer(instance,
                                     context=self.context).data
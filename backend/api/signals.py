@@ -0,0 +1,57 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+from users.models import User
+
+from . import pantry
+from .authentication import token_cache
+from .cache import ingredient_cache, tag_cache
+from .search import ingredient_index
+from .versions import table_versions
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_caches(sender, **kwargs):
+    ingredient_index.invalidate()
+    ingredient_cache.invalidate()
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tag_cache(sender, **kwargs):
+    tag_cache.invalidate()
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipes_version(sender, **kwargs):
+    table_versions.bump('recipes')
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def journal_recipe_ingredients(sender, instance, **kwargs):
+    pantry.recipes_changed(instance.recipe_id)
+
+
+@receiver(post_delete, sender=Recipe)
+def journal_deleted_recipe(sender, instance, **kwargs):
+    pantry.recipes_changed(instance.pk)
+
+
+@receiver((post_save, post_delete), sender=User)
+def bump_users_version(sender, **kwargs):
+    table_versions.bump('users')
+
+
+@receiver(post_save, sender=User)
+def invalidate_user_tokens(sender, instance, created, **kwargs):
+    # Password changes and deactivation go through save().
+    if not created:
+        token_cache.invalidate_user(instance.pk)
+
+
+@receiver(post_delete, sender=Token)
+def invalidate_token(sender, instance, **kwargs):
+    token_cache.invalidate(instance.key)
@@ -0,0 +1,340 @@
+from unittest import skipUnless
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchQuery
+from django.db import connection
+from django.db.utils import load_backend
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework import serializers
+from rest_framework.test import APIClient, APIRequestFactory
+
+from api.cache import tag_cache
+from api.management.commands.explain_queries import (INDEX_USED, explain,
+                                                     hot_queries)
+from api.paginations import CustomPagination
+from api.serializers import RecipeCreateSerializer
+from api.versions import table_versions
+from foodgram.db import base
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingList, Tag)
+from users.models import User
+
+
+class RecipeListQueriesTest(TestCase):
+    """The recipe list costs the same few queries whatever the page size."""
+
+    # Count, recipes with author and per-user flags, tags, ingredients.
+    LIST_QUERIES = 4
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@example.com', password='x'
+        )
+        authors = [
+            User.objects.create(
+                username=f'author{i}', email=f'author{i}@example.com'
+            )
+            for i in range(3)
+        ]
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {i}', color=f'#00000{i}', slug=f'tag{i}'
+            )
+            for i in range(2)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'Ингредиент {i}', measurement_unit='г'
+            )
+            for i in range(3)
+        ]
+        recipes = [
+            Recipe.objects.create(
+                name=f'Рецепт {i:02}', author=authors[i % len(authors)],
+                text='Описание', cooking_time=10,
+                image='recipe_images/test.png'
+            )
+            for i in range(60)
+        ]
+        for recipe in recipes:
+            recipe.tags.set(tags)
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for recipe in recipes for ingredient in ingredients
+        ])
+        Favorite.objects.bulk_create([
+            Favorite(user=cls.user, recipe=recipe) for recipe in recipes[::2]
+        ])
+        ShoppingList.objects.bulk_create([
+            ShoppingList(user=cls.user, recipe=recipe)
+            for recipe in recipes[::3]
+        ])
+
+    def assert_list_queries(self, client):
+        for limit in (6, 60):
+            with self.subTest(limit=limit):
+                with self.assertNumQueries(self.LIST_QUERIES):
+                    response = client.get('/api/recipes/', {
+                        CustomPagination.page_size_query_param: limit
+                    })
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(len(response.data['results']), limit)
+
+    def test_anonymous(self):
+        self.assert_list_queries(APIClient())
+
+    def test_authenticated(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assert_list_queries(client)
+
+
+class RecipeNameRaceTest(TestCase):
+    """A name taken between validation and save is a 400, not a 500."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='author', email='author@example.com'
+        )
+        cls.tag = Tag.objects.create(name='Тег', color='#000000', slug='tag')
+        cls.ingredient = Ingredient.objects.create(
+            name='Ингредиент', measurement_unit='г'
+        )
+        cls.recipe = Recipe.objects.create(
+            name='Рецепт', author=cls.user, text='Описание',
+            cooking_time=10, image='recipe_images/test.png'
+        )
+
+    def serializer(self, name, instance=None):
+        # Partial: the image is beside the point and would land in MEDIA_ROOT.
+        request = APIRequestFactory().post('/api/recipes/')
+        request.user = self.user
+        serializer = RecipeCreateSerializer(instance, data={
+            'name': name, 'text': 'Описание', 'cooking_time': 5,
+            'tags': [self.tag.pk],
+            'ingredients': [{'id': self.ingredient.pk, 'amount': 1}],
+        }, partial=True, context={'request': request})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        return serializer
+
+    def take_name(self, name):
+        Recipe.objects.create(
+            name=name, author=self.user, text='Описание',
+            cooking_time=10, image='recipe_images/test.png'
+        )
+
+    def assert_duplicate(self, serializer):
+        with self.assertRaises(serializers.ValidationError) as raised:
+            serializer.save()
+        self.assertEqual(
+            raised.exception.get_codes(),
+            {'non_field_errors': ['duplicate_name']}
+        )
+
+    def test_create(self):
+        serializer = self.serializer('Новый рецепт')
+        self.take_name('Новый рецепт')
+        self.assert_duplicate(serializer)
+        self.assertEqual(Recipe.objects.filter(name='Новый рецепт').count(), 1)
+
+    def test_update(self):
+        serializer = self.serializer('Другой рецепт', self.recipe)
+        self.take_name('Другой рецепт')
+        self.assert_duplicate(serializer)
+        self.recipe.refresh_from_db()
+        self.assertEqual(self.recipe.name, 'Рецепт')
+
+
+class ReferenceCacheTest(TestCase):
+    """A version bump from another worker reaches this worker's LRU."""
+
+    def setUp(self):
+        self.tag = Tag.objects.create(
+            name='Завтрак', color='#000000', slug='breakfast'
+        )
+        tag_cache.invalidate()
+
+    def test_bump_without_local_invalidate(self):
+        client = APIClient()
+        self.assertEqual(client.get('/api/tags/').json()[0]['name'], 'Завтрак')
+        # Another worker's write: the row and the version change, this
+        # worker's LRU is not cleared.
+        Tag.objects.filter(pk=self.tag.pk).update(name='Обед')
+        table_versions.bump('tags')
+        response = client.get('/api/tags/')
+        self.assertEqual(response.json()[0]['name'], 'Обед')
+        self.assertEqual(client.get(
+            '/api/tags/', HTTP_IF_NONE_MATCH=response['ETag']
+        ).status_code, 304)
+
+
+class UserVersionTest(TestCase):
+    """Successful writes move the user's version, which pins their reads
+    to the primary and changes their per-user ETags."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='author', email='author@example.com'
+        )
+        cls.recipe = Recipe.objects.create(
+            name='Рецепт', author=cls.user, text='Описание',
+            cooking_time=10, image='recipe_images/test.png'
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assert_bumps(self, bumps, method, url):
+        version = table_versions.get(f'user:{self.user.pk}')
+        getattr(self.client, method)(url)
+        self.assertEqual(
+            table_versions.get(f'user:{self.user.pk}') != version, bumps
+        )
+
+    def test_writes(self):
+        url = f'/api/recipes/{self.recipe.pk}/'
+        self.assert_bumps(True, 'post', url + 'favorite/')
+        self.assert_bumps(False, 'get', url)
+        self.assert_bumps(True, 'delete', url)
+        self.assert_bumps(False, 'delete', url)
+
+
+class IngredientSearchTest(TestCase):
+    """``?name=`` ranks prefix matches first, in lists and detail alike."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.ingredients = {
+            name: Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('сахарная пудра', 'сахар', 'тростниковый сахар',
+                         'соль')
+        }
+
+    def test_list(self):
+        response = APIClient().get('/api/ingredients/', {'name': 'сах'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            [item['name'] for item in response.json()],
+            ['сахар', 'сахарная пудра', 'тростниковый сахар']
+        )
+
+    def test_retrieve(self):
+        url = f'/api/ingredients/{self.ingredients["сахар"].pk}/'
+        for name, status in (('сах', 200), ('соль', 404)):
+            with self.subTest(name=name):
+                response = APIClient().get(url, {'name': name})
+                self.assertEqual(response.status_code, status)
+
+
+@skipUnless(
+    connection.vendor == 'postgresql', 'search_vector is PostgreSQL-only'
+)
+class SearchVectorTest(TestCase):
+    """Saves refresh ``search_vector`` only when name or text changed."""
+
+    def setUp(self):
+        self.recipe = Recipe.objects.create(
+            name='Борщ', author=User.objects.create(
+                username='author', email='author@example.com'
+            ),
+            text='Свёкла и капуста', cooking_time=10,
+            image='recipe_images/test.png'
+        )
+
+    def found(self, word):
+        return Recipe.objects.filter(search_vector=SearchQuery(
+            word, config=settings.RECIPE_SEARCH_CONFIG
+        )).exists()
+
+    def vector_updates(self, recipe, **kwargs):
+        with CaptureQueriesContext(connection) as queries:
+            recipe.save(**kwargs)
+        return sum('"search_vector"' in query['sql'] for query in queries)
+
+    def test_updates(self):
+        self.assertTrue(self.found('капуста'))
+        self.recipe.cooking_time = 20
+        self.assertEqual(self.vector_updates(self.recipe), 0)
+        self.assertEqual(self.vector_updates(
+            self.recipe, update_fields=['cooking_time']
+        ), 0)
+        self.assertEqual(
+            self.vector_updates(Recipe.objects.get(pk=self.recipe.pk)), 0
+        )
+        self.assertTrue(self.found('капуста'))
+        self.recipe.text = 'Свёкла и морковь'
+        self.assertEqual(self.vector_updates(self.recipe), 1)
+        self.assertTrue(self.found('морковь'))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'EXPLAIN plans are PostgreSQL')
+class QueryPlanTest(TestCase):
+    """Hot queries use their indexes, and would not without them."""
+
+    # Index -> hot query (see explain_queries) it exists for.
+    INDEXES = {
+        'recipe_pub_date_id_idx': 'recipes_cursor',
+        'favorite_recipe_user_idx': 'recipe_favorites',
+    }
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(
+            username='reader', email='reader@example.com'
+        )
+        recipes = [
+            Recipe.objects.create(
+                name=f'Рецепт {i:03}', author=cls.user, text='Описание',
+                cooking_time=10, image='recipe_images/test.png'
+            )
+            for i in range(100)
+        ]
+        Favorite.objects.create(user=cls.user, recipe=recipes[0])
+
+    def setUp(self):
+        with connection.cursor() as cursor:
+            # Test tables are tiny; a sequential scan would always win.
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def used_indexes(self, name):
+        return set(INDEX_USED.findall(explain(hot_queries(self.user)[name])))
+
+    def test_indexes_used(self):
+        for index, name in self.INDEXES.items():
+            with self.subTest(index=index):
+                self.assertIn(index, self.used_indexes(name))
+                with connection.cursor() as cursor:
+                    # Rolled back with the test transaction.
+                    cursor.execute(f'DROP INDEX {index}')
+                self.assertNotIn(index, self.used_indexes(name))
+
+
+@skipUnless(
+    connection.settings_dict['ENGINE'] == 'foodgram.db',
+    'The pool is part of the foodgram.db backend'
+)
+class ConnectionPoolTest(SimpleTestCase):
+    """Pooled connections open and are reused with health checks on."""
+
+    alias = 'pool_test'
+
+    def tearDown(self):
+        base._pools.pop(self.alias).closeall()
+
+    def test_health_checks(self):
+        wrapper = load_backend('foodgram.db').DatabaseWrapper({
+            **connection.settings_dict,
+            'CONN_MAX_AGE': 0, 'POOL_SIZE': 1, 'CONN_HEALTH_CHECKS': True,
+        }, alias=self.alias)
+        for attempt in range(2):
+            with self.subTest(attempt=attempt):
+                with wrapper.cursor() as cursor:
+                    cursor.execute('SELECT 1')
+                    self.assertEqual(cursor.fetchone(), (1,))
+                self.assertTrue(wrapper.get_autocommit())
+                wrapper.close()
@@ -0,0 +1,72 @@
+from django.db import connections, router
+
+
+def columns(model, field_name):
+    field = model._meta.get_field(field_name)
+    target = field.related_model._meta
+    return (
+        model._meta.get_field('user').column,
+        field.column,
+        target.db_table,
+        target.pk.column,
+    )
+
+
+def execute(connection, sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def add(model, user_id, field_name, ids):
+    """Link the user to every existing target in ``ids`` in one statement.
+
+    Relies on the model's (user, target) unique constraint; returns the
+    ids that were actually inserted.
+    """
+    ids = list(ids)
+    if not ids:
+        return []
+    user_column, column, target_table, target_pk = columns(
+        model, field_name
+    )
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    sql = (
+        '{insert} {table} ({user_column}, {column}) '
+        'SELECT %s, {target_pk} FROM {target_table} '
+        'WHERE {target_pk} IN ({placeholders}) '
+        '{on_conflict} RETURNING {column}'
+    ).format(
+        insert=connection.ops.insert_statement(ignore_conflicts=True),
+        table=quote(model._meta.db_table),
+        user_column=quote(user_column),
+        column=quote(column),
+        target_pk=quote(target_pk),
+        target_table=quote(target_table),
+        placeholders=', '.join(['%s'] * len(ids)),
+        on_conflict=connection.ops.ignore_conflicts_suffix_sql(
+            ignore_conflicts=True
+        ),
+    )
+    return execute(connection, sql, [user_id, *ids])
+
+
+def remove(model, user_id, field_name, ids):
+    """Unlink the user from ``ids`` in one statement; returns removed ids."""
+    ids = list(ids)
+    if not ids:
+        return []
+    user_column, column, _, _ = columns(model, field_name)
+    connection = connections[router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    sql = (
+        'DELETE FROM {table} WHERE {user_column} = %s '
+        'AND {column} IN ({placeholders}) RETURNING {column}'
+    ).format(
+        table=quote(model._meta.db_table),
+        user_column=quote(user_column),
+        column=quote(column),
+        placeholders=', '.join(['%s'] * len(ids)),
+    )
+    return execute(connection, sql, [user_id, *ids])
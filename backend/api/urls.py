@@ -2,6 +2,7 @@ from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
 from . import views
+from .concurrency import concurrent_urls
 
 router = DefaultRouter()
 router.register(r'recipes', views.RecipeViewSet, basename='recipes')
@@ -11,6 +12,7 @@ router.register(
     r'ingredients', views.IngredientViewSet, basename='ingredients')
 
 urlpatterns = [
-    path('', include(router.urls)),
+    path('_metrics', views.MetricsView.as_view(), name='metrics'),
+    path('', include(concurrent_urls(router.urls))),
     path(r'auth/', include('djoser.urls.authtoken')),
 ]
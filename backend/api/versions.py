@@ -0,0 +1,40 @@
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class TableVersions:
+    """Last-change timestamps per table, kept in the shared cache.
+
+    Signals bump them on writes; readers use them as cache keys and as
+    ETag/Last-Modified validators without touching the database.
+    """
+
+    @property
+    def cache(self):
+        return caches[settings.REFERENCE_CACHE_ALIAS]
+
+    def key(self, name):
+        return f'table-version:{name}'
+
+    def get(self, name):
+        return self.get_many([name])[0]
+
+    def get_many(self, names):
+        keys = [self.key(name) for name in names]
+        stored = self.cache.get_many(keys)
+        versions = []
+        for key in keys:
+            if key not in stored:
+                self.cache.add(key, time.time(), None)
+                stored[key] = self.cache.get(key)
+            versions.append(stored[key])
+        return versions
+
+    def bump(self, *names):
+        now = time.time()
+        self.cache.set_many({self.key(name): now for name in names}, None)
+
+
+table_versions = TableVersions()
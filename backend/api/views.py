@@ -1,33 +1,59 @@
-from django.db.models import Sum
-from django.http import HttpResponse
-from django.shortcuts import get_object_or_404
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import BooleanField, Value
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import (AllowAny, IsAuthenticated,
+from rest_framework.permissions import (AllowAny, IsAdminUser, IsAuthenticated,
                                         IsAuthenticatedOrReadOnly)
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
-from foodgram.settings import FILE_NAME
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingList, Tag)
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingList,
+                            ShoppingListTotal, Tag)
 from users.models import Follow, User
 
+from . import activity, counters, pantry, toggles
+from .cache import (CachedReadMixin, ConditionalGetMixin, ingredient_cache,
+                    tag_cache)
 from .filters import IngredientFilter, RecipeFilter
-from .paginations import CustomPagination
+from .metrics import registry
+from .paginations import CustomPagination, FeedPagination, KeysetPagination
+from .renderers import SHOPPING_LIST_RENDERERS
+from .routing import ReplicaReadMixin
 from .serializers import (FollowsSerializer, IngredientSerializer,
-                          RecipeCreateSerializer, RecipeReadSerializer,
+                          PantryRecipeSerializer, PantrySerializer,
+                          RecipeCreateSerializer, RecipeIdsSerializer,
+                          RecipeReadSerializer, RecipesLimitSerializer,
                           SetPasswordSerializer, TagSerializer,
                           UserCreateSerializer, UserReadSerializer)
 
+SHOPPING_LIST_CHUNK_SIZE = 500
+RECIPE_COUNTERS = {
+    Favorite: 'favorites_count',
+    ShoppingList: 'shopping_cart_count',
+}
+
+
+def parse_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise Http404
 
-class UserViewSet(mixins.CreateModelMixin,
+
+class UserViewSet(ReplicaReadMixin,
+                  mixins.CreateModelMixin,
                   mixins.ListModelMixin,
                   mixins.RetrieveModelMixin,
                   viewsets.GenericViewSet):
     queryset = User.objects.all()
     permission_classes = (AllowAny,)
     pagination_class = CustomPagination
+    cursor_ordering = ('-id',)
 
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
@@ -53,10 +79,22 @@ class UserViewSet(mixins.CreateModelMixin,
 
     @action(detail=False, methods=['get'],
             permission_classes=(IsAuthenticated,),
-            pagination_class=CustomPagination)
+            pagination_class=FeedPagination)
     def subscriptions(self, request):
-        queryset = User.objects.filter(subscribing__user=request.user)
+        limit = RecipesLimitSerializer.from_request(request)
+        queryset = User.objects.filter(
+            subscribing__user=request.user
+        ).annotate(
+            is_follow=Value(True, output_field=BooleanField())
+        ).order_by(*self.cursor_ordering)
         page = self.paginate_queryset(queryset)
+        recipes = defaultdict(list)
+        for recipe in Recipe.objects.latest_by_author(
+            [author.pk for author in page], limit
+        ).prefetch_related('tags'):
+            recipes[recipe.author_id].append(recipe)
+        for author in page:
+            author.latest_recipes = recipes[author.pk]
         serializer = FollowsSerializer(
             page,
             many=True,
@@ -65,132 +103,303 @@ class UserViewSet(mixins.CreateModelMixin,
         return self.get_paginated_response(serializer.data)
 
     @action(detail=True, methods=['post', 'delete'],
-            permission_classes=(AllowAny,))
+            permission_classes=(IsAuthenticated,))
     def subscribe(self, request, **kwargs):
-        author = get_object_or_404(User, id=kwargs['pk'])
+        author_id = parse_id(kwargs['pk'])
+        if author_id == request.user.pk:
+            return Response(
+                {'errors': 'Невозможно подписаться на самого себя.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
         if request.method == 'POST':
-            Follow.objects.create(user=request.user, author=author)
-            return Response({'detail': 'Вы подписались', 'author': author.id},
-                            status=status.HTTP_201_CREATED)
-
-        if request.method == 'DELETE':
-            subscribe_instance = get_object_or_404(
-                Follow,
-                user=request.user,
-                author=author
+            with transaction.atomic():
+                added = toggles.add(
+                    Follow, request.user.pk, 'author', [author_id]
+                )
+                if added:
+                    counters.adjust(User, author_id, 'followers_count', 1)
+                    activity.backfill(
+                        request.user.pk, User.objects.get(pk=author_id)
+                    )
+            if not added and not User.objects.filter(pk=author_id).exists():
+                raise Http404
+            return Response(
+                {'detail': 'Вы подписались', 'author': author_id},
+                status=(
+                    status.HTTP_201_CREATED if added else status.HTTP_200_OK
+                )
             )
-            subscribe_instance.delete()
-            return Response({'detail': 'Вы отписались', 'author': author.id},
-                            status=status.HTTP_200_OK)
 
+        with transaction.atomic():
+            if toggles.remove(Follow, request.user.pk, 'author', [author_id]):
+                counters.adjust(User, author_id, 'followers_count', -1)
+                activity.remove(request.user.pk, author_id)
+        return Response({'detail': 'Вы отписались', 'author': author_id},
+                        status=status.HTTP_200_OK)
 
-class TagViewSet(mixins.ListModelMixin,
+
+class TagViewSet(ReplicaReadMixin,
+                 ConditionalGetMixin,
+                 CachedReadMixin,
+                 mixins.ListModelMixin,
                  mixins.RetrieveModelMixin,
                  viewsets.GenericViewSet):
     permission_classes = (AllowAny, )
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
+    reference_cache = tag_cache
+    version_tables = ('tags',)
 
 
-class IngredientViewSet(mixins.ListModelMixin,
+class IngredientViewSet(ReplicaReadMixin,
+                        ConditionalGetMixin,
+                        CachedReadMixin,
+                        mixins.ListModelMixin,
                         mixins.RetrieveModelMixin,
                         viewsets.GenericViewSet):
     queryset = Ingredient.objects.all()
     permission_classes = (AllowAny, )
     serializer_class = IngredientSerializer
     pagination_class = None
+    reference_cache = ingredient_cache
+    version_tables = ('ingredients',)
     filter_backends = (IngredientFilter, )
-    search_fields = ('name', )
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+class RecipeViewSet(ReplicaReadMixin,
+                    ConditionalGetMixin,
+                    viewsets.ModelViewSet):
     queryset = Recipe.objects.all()
-    pagination_class = CustomPagination
+    pagination_class = FeedPagination
+    ordering_param = 'ordering'
+    popular_ordering = ('-favorites_count', '-id')
+    search_param = 'search'
+    search_ordering = ('-search_rank', '-id')
+    version_tables = ('recipes', 'tags', 'ingredients', 'users')
+    per_user_versions = True
     permission_classes = (IsAuthenticatedOrReadOnly, )
     filter_backends = (DjangoFilterBackend, )
     filterset_class = RecipeFilter
     http_method_names = ['get', 'post', 'patch', 'create', 'delete']
 
+    def is_popular(self):
+        return (
+            self.request.query_params.get(self.ordering_param) == 'popular'
+        )
+
+    def is_search(self):
+        return bool(
+            self.request.query_params.get(self.search_param, '').strip()
+        )
+
+    @property
+    def cursor_ordering(self):
+        if self.is_search():
+            return self.search_ordering
+        if self.is_popular():
+            return self.popular_ordering
+        return ('-pub_date', '-id')
+
+    def get_version_tables(self, request):
+        if self.is_popular():
+            return self.version_tables + ('popularity',)
+        return self.version_tables
+
+    def get_queryset(self):
+        if self.action in ('list', 'retrieve'):
+            queryset = Recipe.objects.for_read(self.request.user)
+            if self.is_popular():
+                queryset = queryset.order_by(*self.popular_ordering)
+            return queryset
+        return super().get_queryset()
+
     def get_serializer_class(self):
         if self.action in ('list', 'retrieve'):
             return RecipeReadSerializer
         return RecipeCreateSerializer
 
-    @action(detail=True, methods=['post', 'delete'],
-            permission_classes=(IsAuthenticated,))
-    def favorite(self, request, **kwargs):
-        recipe = get_object_or_404(Recipe, id=kwargs['pk'])
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        ShoppingListTotal.objects.apply_recipe(
+            instance,
+            instance.shopping_cart.values_list('user_id', flat=True),
+            sign=-1
+        )
+        if instance.author_id:
+            counters.adjust(User, instance.author_id, 'recipes_count', -1)
+        instance.delete()
 
+    @action(detail=False, methods=['get'],
+            permission_classes=(IsAuthenticated,),
+            pagination_class=KeysetPagination)
+    def feed(self, request):
+        keys = self.paginator.paginate_keys(
+            lambda after, size: activity.page(request.user, after, size),
+            request
+        )
+        recipes = Recipe.objects.for_read(request.user).in_bulk(
+            [pk for _, pk in keys]
+        )
         serializer = RecipeReadSerializer(
-            instance=recipe,
+            [recipes[pk] for _, pk in keys if pk in recipes],
+            many=True,
             context={'request': request}
         )
-        serializer.is_valid(raise_exception=True)
+        return self.get_paginated_response(serializer.data)
 
-        if request.method == 'POST':
-            if not serializer.get_is_favorited(recipe):
-                Favorite.objects.create(user=request.user, recipe=recipe)
-                return Response(
-                    {'detail': 'Рецепт добавлен в избранное.'},
-                    status=status.HTTP_201_CREATED
+    @action(detail=False, methods=['get'], pagination_class=CustomPagination)
+    def cookable(self, request):
+        params = PantrySerializer.from_request(request)
+        matches = pantry.ingredient_recipe_index.match(
+            params['ingredients'], params.get('max_missing')
+        )
+        page = self.paginate_queryset(matches)
+        recipes = Recipe.objects.for_read(request.user).in_bulk(page)
+        serializer = PantryRecipeSerializer(
+            [recipes[pk] for pk in page if pk in recipes],
+            many=True,
+            context={
+                'request': request,
+                'pantry': set(params['ingredients']),
+            }
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, **kwargs):
+        recipe_id = parse_id(kwargs['pk'])
+        recipes = list(
+            Recipe.objects.for_read(request.user)
+            .filter(similar_to__recipe_id=recipe_id)
+            .order_by('-similar_to__score', '-id')
+        )
+        if not recipes and not Recipe.objects.filter(pk=recipe_id).exists():
+            raise Http404
+        serializer = RecipeReadSerializer(
+            recipes, many=True, context={'request': request}
+        )
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['get'],
+            permission_classes=(IsAuthenticated,))
+    def recommended(self, request):
+        queryset = Recipe.objects.for_read(request.user)
+        recipes = list(
+            queryset.filter(recommended_to__user=request.user)
+            .order_by('-recommended_to__score', '-id')
+        )
+        if not recipes:
+            # Not computed yet, or nothing saved to learn from.
+            recipes = queryset.order_by(*self.popular_ordering)[
+                :settings.RECOMMENDATIONS_PER_USER
+            ]
+        serializer = RecipeReadSerializer(
+            recipes, many=True, context={'request': request}
+        )
+        return Response(serializer.data)
+
+    def link_recipes(self, request, model, recipe_ids):
+        """Add (POST) or remove (DELETE) links; returns changed recipe ids."""
+        user_id = request.user.pk
+        sign = 1 if request.method == 'POST' else -1
+        with transaction.atomic():
+            if sign > 0:
+                changed = toggles.add(model, user_id, 'recipe', recipe_ids)
+            else:
+                changed = toggles.remove(model, user_id, 'recipe', recipe_ids)
+            if changed:
+                if model is ShoppingList:
+                    ShoppingListTotal.objects.apply_recipes(
+                        changed, [user_id], sign
+                    )
+                counters.adjust_many(
+                    Recipe, changed, RECIPE_COUNTERS[model], sign
                 )
-            return Response(
-                {'errors': 'Вы уже добавили этот рецепт.'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
+        return changed
 
+    def toggle_recipe(self, request, model, pk, added, removed):
+        recipe_id = parse_id(pk)
+        changed = self.link_recipes(request, model, [recipe_id])
         if request.method == 'DELETE':
-            request.user.favorites.filter(recipe=recipe).delete()
-            return Response({'detail': 'Рецепт убран из избранного.'},
+            return Response({'detail': removed},
                             status=status.HTTP_204_NO_CONTENT)
+        if not changed and not Recipe.objects.filter(pk=recipe_id).exists():
+            raise Http404
+        return Response(
+            {'detail': added},
+            status=status.HTTP_201_CREATED if changed else status.HTTP_200_OK
+        )
+
+    def toggle_recipes(self, request, model):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        changed = self.link_recipes(
+            request, model, serializer.validated_data['recipes']
+        )
+        return Response({'recipes': sorted(changed)},
+                        status=status.HTTP_200_OK)
+
+    @action(detail=True, methods=['post', 'delete'],
+            permission_classes=(IsAuthenticated,))
+    def favorite(self, request, **kwargs):
+        return self.toggle_recipe(
+            request, Favorite, kwargs['pk'],
+            added='Рецепт добавлен в избранное.',
+            removed='Рецепт убран из избранного.'
+        )
+
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='favorite', url_name='favorite-batch',
+            permission_classes=(IsAuthenticated,))
+    def favorite_batch(self, request):
+        return self.toggle_recipes(request, Favorite)
 
     @action(detail=True, methods=['post', 'delete'],
             permission_classes=(IsAuthenticated,),
             pagination_class=None)
     def shopping_cart(self, request, **kwargs):
-        recipe = get_object_or_404(Recipe, id=kwargs['pk'])
-
-        if request.method == 'POST':
-            serializer = RecipeReadSerializer(
-                instance=recipe,
-                context={'request': request}
-            )
-            if serializer.is_valid(raise_exception=True):
-                serializer.add_to_shopping_cart(request.user, recipe)
-                return Response(
-                    {'detail': 'Рецепт добавлен в корзину покупок.'},
-                    status=status.HTTP_201_CREATED
-                )
+        return self.toggle_recipe(
+            request, ShoppingList, kwargs['pk'],
+            added='Рецепт добавлен в корзину покупок.',
+            removed='Рецепт удален из корзины покупок.'
+        )
 
-        if request.method == 'DELETE':
-            shopping_list_item = get_object_or_404(
-                ShoppingList,
-                user=request.user,
-                recipe=recipe
-            )
-            shopping_list_item.delete()
-            return Response(
-                {'detail': 'Рецепт удален из корзины покупок.'},
-                status=status.HTTP_204_NO_CONTENT
-            )
+    @action(detail=False, methods=['post', 'delete'],
+            url_path='shopping_cart', url_name='shopping-cart-batch',
+            permission_classes=(IsAuthenticated,))
+    def shopping_cart_batch(self, request):
+        return self.toggle_recipes(request, ShoppingList)
 
     @action(detail=False, methods=['get'],
-            permission_classes=(AllowAny,))
+            permission_classes=(IsAuthenticated,),
+            renderer_classes=SHOPPING_LIST_RENDERERS)
     def download_shopping_cart(self, request, **kwargs):
         ingredients = (
-            RecipeIngredient.objects
-            .filter(recipe__shopping_cart__user=request.user)
-            .values('ingredient')
-            .annotate(total_amount=Sum('amount'))
-            .values_list('ingredient__name', 'total_amount',
+            ShoppingListTotal.objects
+            .filter(user=request.user)
+            .order_by('ingredient__name')
+            .values_list('ingredient__name', 'amount',
                          'ingredient__measurement_unit')
+            .iterator(chunk_size=SHOPPING_LIST_CHUNK_SIZE)
+        )
+        renderer = request.accepted_renderer
+        response = StreamingHttpResponse(
+            renderer.stream(ingredients),
+            content_type=renderer.get_content_type()
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename={renderer.get_filename()}'
+        )
+        return response
+
+
+class MetricsView(APIView):
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        return HttpResponse(
+            registry.render(),
+            content_type='text/plain; version=0.0.4; charset=utf-8'
         )
-        file_list = []
-        [file_list.append(
-            '{} - {} {}.'.format(*ingredient)) for ingredient in ingredients]
-        file = HttpResponse('Cписок покупок:\n' + '\n'.join(file_list),
-                            content_type='description/plain')
-        file['Content-Disposition'] = (f'attachment; filename={FILE_NAME}')
-        return file
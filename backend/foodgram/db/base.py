@@ -0,0 +1,119 @@
+"""PostgreSQL backend with health checks and an optional in-process pool.
+
+Extra keys in ``DATABASES[alias]``:
+
+* ``CONN_HEALTH_CHECKS`` -- ping a reused persistent connection before
+  its first query in a request (the Django 4.1 setting, backported).
+* ``POOL_SIZE`` -- keep up to this many connections per process in a
+  ``psycopg2`` pool; closing a connection returns it to the pool.
+"""
+import threading
+
+from django.db.backends.postgresql import base
+from psycopg2 import extensions, extras, pool
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, conn_params, size):
+    with _pools_lock:
+        if alias not in _pools:
+            # psycopg2 closes returned connections beyond minconn, so the
+            # pool is opened full.
+            _pools[alias] = pool.ThreadedConnectionPool(
+                size, size, **conn_params
+            )
+        return _pools[alias]
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = False
+
+    @property
+    def health_check_enabled(self):
+        return self.settings_dict.get('CONN_HEALTH_CHECKS', False)
+
+    @property
+    def pool_size(self):
+        return self.settings_dict.get('POOL_SIZE') or 0
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+
+    def get_new_connection(self, conn_params):
+        if not self.pool_size:
+            return super().get_new_connection(conn_params)
+        connections = get_pool(self.alias, conn_params, self.pool_size)
+        for _ in range(self.pool_size + 1):
+            connection = connections.getconn()
+            if not connection.closed and (
+                not self.health_check_enabled or self.ping(connection)
+            ):
+                break
+            connections.putconn(connection, close=True)
+        else:
+            raise base.Database.OperationalError(
+                'No usable connection in the pool.'
+            )
+        extras.register_default_jsonb(
+            conn_or_curs=connection, loads=lambda x: x
+        )
+        options = self.settings_dict['OPTIONS']
+        self.isolation_level = options.get(
+            'isolation_level', connection.isolation_level
+        )
+        if self.isolation_level != connection.isolation_level:
+            connection.set_session(isolation_level=self.isolation_level)
+        return connection
+
+    def _close(self):
+        if self.connection is None or not self.pool_size:
+            return super()._close()
+        connection = self.connection
+        broken = connection.closed or self.errors_occurred
+        if not broken and connection.get_transaction_status() != (
+            extensions.TRANSACTION_STATUS_IDLE
+        ):
+            try:
+                connection.rollback()
+            except base.Database.Error:
+                broken = True
+        get_pool(self.alias, None, self.pool_size).putconn(
+            connection, close=broken
+        )
+
+    def ping(self, connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            # A new connection is not in autocommit yet, so the ping
+            # opened a transaction; connect() could not switch it on.
+            connection.rollback()
+        except base.Database.Error:
+            return False
+        return True
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
+
+    def close_if_health_check_failed(self):
+        if (
+            self.connection is None
+            or not self.health_check_enabled
+            or self.health_check_done
+            or self.in_atomic_block
+        ):
+            return
+        if not self.is_usable():
+            self.close()
+        self.health_check_done = True
+
+    def _cursor(self, name=None):
+        self.close_if_health_check_failed()
+        return super()._cursor(name)
@@ -0,0 +1,37 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+_read_alias = ContextVar('read_alias', default=None)
+
+
+@contextmanager
+def reads_from(alias):
+    """Route ORM reads in this context to ``alias`` (None: the default)."""
+    token = _read_alias.set(alias)
+    try:
+        yield
+    finally:
+        _read_alias.reset(token)
+
+
+def pin_primary():
+    """Send the rest of the current context's reads to the primary."""
+    _read_alias.set(None)
+
+
+class ReplicaRouter:
+    """Reads go to the replica only inside ``reads_from(replica)``."""
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != settings.DATABASE_REPLICA_ALIAS
@@ -15,6 +15,15 @@ AUTH_USER_MODEL = 'users.User'
 
 WSGI_APPLICATION = "foodgram.wsgi.application"
 
+# 'wsgi' or 'asgi'; see gunicorn.conf.py.
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi').lower()
+# Threads that run read-only API views under ASGI. Each may hold a
+# database connection, so keep DB_POOL_SIZE above this.
+ASGI_THREADS = int(os.getenv('ASGI_THREADS', 16))
+# Worker processes; more than one needs a cache they all share, see
+# api/checks.py.
+SERVER_WORKERS = int(os.getenv('GUNICORN_WORKERS', 1))
+
 INSTALLED_APPS = [
     'django.contrib.admin',
     'django.contrib.auth',
@@ -29,10 +38,10 @@ INSTALLED_APPS = [
     'rest_framework.authtoken',
     'djoser',
     'django_filters',
-    'drf_base64',
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -63,16 +72,73 @@ TEMPLATES = [
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
 
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 0))
+DB_STATEMENT_TIMEOUT = int(os.getenv('DB_STATEMENT_TIMEOUT', 0))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        # PostgreSQL plus health checks and the optional pool, see
+        # foodgram/db/base.py.
+        'ENGINE': 'foodgram.db',
         'NAME': os.getenv('POSTGRES_DB', 'django'),
         'USER': os.getenv('POSTGRES_USER', 'django'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        # With the pool, returning a connection after each request is
+        # cheap and lets threads share them.
+        'CONN_MAX_AGE': int(
+            os.getenv('DB_CONN_MAX_AGE', 0 if DB_POOL_SIZE else 60)
+        ),
+        'CONN_HEALTH_CHECKS': (
+            os.getenv('DB_CONN_HEALTH_CHECKS', 'True').lower() == 'true'
+        ),
+        'POOL_SIZE': DB_POOL_SIZE,
+        'OPTIONS': {
+            'connect_timeout': int(os.getenv('DB_CONNECT_TIMEOUT', 5)),
+        },
     }
 }
+if DB_STATEMENT_TIMEOUT:
+    # Milliseconds; applies to migrations and management commands too.
+    DATABASES['default']['OPTIONS']['options'] = (
+        f'-c statement_timeout={DB_STATEMENT_TIMEOUT}'
+    )
+
+DATABASE_REPLICA_ALIAS = 'replica'
+# Users who wrote this recently read from the primary.
+DATABASE_REPLICA_STICKY_SECONDS = int(
+    os.getenv('DB_REPLICA_STICKY_SECONDS', 5)
+)
+if os.getenv('DB_REPLICA_HOST'):
+    DATABASES[DATABASE_REPLICA_ALIAS] = {
+        **DATABASES['default'],
+        'HOST': os.getenv('DB_REPLICA_HOST'),
+        'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_ROUTERS = ['foodgram.db.routers.ReplicaRouter']
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+REFERENCE_CACHE_ALIAS = 'default'
+REFERENCE_CACHE_TIMEOUT = 60 * 60
+REFERENCE_CACHE_LOCAL_TTL = 10
+REFERENCE_CACHE_LOCAL_SIZE = 512
+# Token -> user snapshots; None keeps them in the per-worker LRU only.
+AUTH_TOKEN_CACHE_ALIAS = 'default'
+AUTH_TOKEN_CACHE_TIMEOUT = 5 * 60
+# Bounds how long other workers honour a token after logout.
+AUTH_TOKEN_CACHE_LOCAL_TTL = 10
+AUTH_TOKEN_CACHE_LOCAL_SIZE = 1024
 
 
 AUTH_PASSWORD_VALIDATORS = [
@@ -95,7 +161,7 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.AllowAny',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachingTokenAuthentication',
     ],
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend',
@@ -139,9 +205,59 @@ CORS_URLS_REGEX = r'^/api/.*$'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
-FILE_NAME = 'shopping-list.txt'
+SLOW_REQUEST_THRESHOLD = float(os.getenv('SLOW_REQUEST_THRESHOLD', 0.5))
+SLOW_REQUEST_TOP_QUERIES = 5
 
+FILE_NAME = 'shopping-list.txt'
+SHOPPING_LIST_PDF_FONT = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+
+INGREDIENT_SEARCH_LIMIT = 20
+INGREDIENT_SEARCH_INDEX_TTL = 300
+# Text search configuration of Recipe.search_vector (PostgreSQL).
+RECIPE_SEARCH_CONFIG = 'russian'
+# Most matches the in-process fallback index ranks (SQLite).
+RECIPE_SEARCH_FALLBACK_LIMIT = 1000
+# Upper bound (and default) for ?recipes_limit= in subscriptions.
+SUBSCRIPTION_RECIPES_LIMIT = 50
+# Authors with at least this many followers are not fanned out on write;
+# their recipes are merged into feeds at read time.
+FEED_FANOUT_MAX_FOLLOWERS = int(os.getenv('FEED_FANOUT_MAX_FOLLOWERS', 1000))
+FEED_BACKFILL_SIZE = 100
+# Most ingredient ids one ?ingredients= "what can I cook" query may list.
+PANTRY_MAX_INGREDIENTS = 100
+# Per-worker ingredient -> recipes index: journal entries older than the
+# timeout, or a backlog above MAX_REPLAY, force a full rebuild.
+PANTRY_INDEX_JOURNAL_TIMEOUT = 24 * 60 * 60
+PANTRY_INDEX_MAX_REPLAY = 1000
+# Ingredient postings kept as bitmaps, about max recipe id / 8 bytes each.
+PANTRY_INDEX_BITMAP_CACHE_SIZE = 256
+# Precomputed similar / recommended recipes (compute_recommendations):
+# neighbours kept per recipe, recommendations per user, rows per batch.
+RECOMMENDATIONS_NEIGHBORS = 20
+RECOMMENDATIONS_PER_USER = 50
+RECOMMENDATIONS_BATCH_SIZE = 1000
+# How much a favorite and a shopping cart entry say about taste.
+RECOMMENDATIONS_FAVORITE_WEIGHT = 1.0
+RECOMMENDATIONS_CART_WEIGHT = 0.5
+# Most recipes one batch favorite/cart request may add or remove.
+RECIPE_BATCH_SIZE = 100
 
 MIN_VALUE = 1
 MAX_VALUE = 32000
 IMAGE_THUMBNAIL_SIZE = (300, 300)
+IMAGE_RENDITIONS = {
+    'thumbnail': IMAGE_THUMBNAIL_SIZE,
+    'card': (600, 600),
+    'full': (1200, 1200),
+}
+IMAGE_UPLOAD_MAX_SIZE = 5 * 1024 * 1024
+IMAGE_UPLOAD_MAX_PIXELS = 5000 * 5000
+# Base64 in a JSON body is a third larger than the decoded image.
+DATA_UPLOAD_MAX_MEMORY_SIZE = IMAGE_UPLOAD_MAX_SIZE * 4 // 3 + 1024 * 1024
+IMAGE_RENDITION_FORMAT = 'WEBP'
+IMAGE_RENDITION_QUALITY = 80
+IMAGE_PIPELINE_WORKERS = int(os.getenv('IMAGE_PIPELINE_WORKERS', 2))
@@ -0,0 +1,23 @@
+import os
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+workers = int(os.getenv('GUNICORN_WORKERS', 1))
+
+if os.getenv('SERVER_MODE', 'wsgi').lower() == 'asgi':
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    wsgi_app = 'foodgram.asgi:application'
+else:
+    wsgi_app = 'foodgram.wsgi:application'
+
+
+def on_starting(server):
+    """Refuse to start on configuration errors, such as a per-process
+    cache behind several workers; gunicorn skips Django's checks."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'foodgram.settings')
+    # The command line may override the worker count read above.
+    os.environ['GUNICORN_WORKERS'] = str(server.cfg.workers)
+    import django
+    from django.core.management import call_command
+
+    django.setup()
+    call_command('check')
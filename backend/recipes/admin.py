@@ -62,16 +62,13 @@ class CustomUserAdmin(BaseUserAdmin):
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ['name', 'author']
+    list_display = ['name', 'author', 'favorites_count']
     list_filter = ['author', 'tags']
     search_fields = ['name', 'author__username']
     ordering = ['name']
-    readonly_fields = ['favorite_count']
+    readonly_fields = ['favorites_count', 'shopping_cart_count']
     inlines = [IngredientInline]
 
-    def favorite_count(self, obj):
-        return obj.favorites.count()
-
 
 @admin.register(Ingredient)
 class IngredientAdmin(admin.ModelAdmin):
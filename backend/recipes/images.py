@@ -0,0 +1,83 @@
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.IMAGE_PIPELINE_WORKERS,
+                thread_name_prefix='recipe-images'
+            )
+        return _executor
+
+
+def rendition_name(name, rendition):
+    stem = os.path.splitext(name)[0]
+    extension = settings.IMAGE_RENDITION_FORMAT.lower()
+    return f'{stem}.{rendition}.{extension}'
+
+
+def encode(image, image_format, **options):
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def replace(storage, name, content):
+    if storage.exists(name):
+        storage.delete(name)
+    storage.save(name, content)
+
+
+def process_image(storage, name):
+    """Write the renditions of ``name`` and shrink the stored original."""
+    with storage.open(name) as file:
+        source = Image.open(file)
+        source_format = source.format
+        source.load()
+    if source.mode not in ('RGB', 'RGBA'):
+        source = source.convert('RGBA' if 'A' in source.getbands() else 'RGB')
+    for rendition, size in settings.IMAGE_RENDITIONS.items():
+        image = source.copy()
+        image.thumbnail(size)
+        replace(storage, rendition_name(name, rendition), encode(
+            image,
+            settings.IMAGE_RENDITION_FORMAT,
+            quality=settings.IMAGE_RENDITION_QUALITY
+        ))
+    if (
+        source.width > settings.IMAGE_THUMBNAIL_SIZE[0]
+        or source.height > settings.IMAGE_THUMBNAIL_SIZE[1]
+    ):
+        source.thumbnail(settings.IMAGE_THUMBNAIL_SIZE)
+        if source_format == 'JPEG' and source.mode == 'RGBA':
+            source = source.convert('RGB')
+        replace(storage, name, encode(source, source_format))
+
+
+def run(storage, name):
+    try:
+        process_image(storage, name)
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', name)
+
+
+def schedule(storage, name):
+    """Process in the worker pool, or inline when it is disabled."""
+    if settings.IMAGE_PIPELINE_WORKERS:
+        return get_executor().submit(run, storage, name)
+    return run(storage, name)
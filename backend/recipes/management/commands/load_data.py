@@ -0,0 +1,196 @@
+import csv
+import io
+import json
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, connection, transaction
+
+from api.cache import ingredient_cache, tag_cache
+from api.search import ingredient_index
+from recipes.models import Ingredient, Tag
+
+INGREDIENT_FIELDS = ('name', 'measurement_unit')
+TAG_FIELDS = ('name', 'color', 'slug')
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def read_csv(path, fields):
+    with open(path, encoding='utf-8', newline='') as file:
+        for row in csv.reader(file):
+            if row:
+                yield dict(zip(fields, (value.strip() for value in row)))
+
+
+def read_json(path, fields):
+    """Yield objects of a top-level JSON array without loading it whole."""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    started = False
+    with open(path, encoding='utf-8') as file:
+        while True:
+            chunk = file.read(READ_CHUNK_SIZE)
+            buffer += chunk
+            while True:
+                buffer = buffer.lstrip().lstrip(',').lstrip()
+                if not started:
+                    if not buffer:
+                        break
+                    if buffer[0] != '[':
+                        raise CommandError(f'{path}: ожидается JSON-массив.')
+                    buffer = buffer[1:]
+                    started = True
+                    continue
+                if not buffer or buffer[0] == ']':
+                    break
+                try:
+                    item, end = decoder.raw_decode(buffer)
+                except ValueError:
+                    if not chunk:
+                        raise CommandError(f'{path}: некорректный JSON.')
+                    break
+                buffer = buffer[end:]
+                yield {field: str(item[field]).strip() for field in fields}
+            if not chunk:
+                return
+
+
+def read_rows(path, fields):
+    if not os.path.exists(path):
+        raise CommandError(f'Файл {path} не найден.')
+    if path.endswith('.json'):
+        return read_json(path, fields)
+    return read_csv(path, fields)
+
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class Command(BaseCommand):
+    help = 'Загружает ингредиенты и теги из CSV или JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ingredients',
+            default=os.path.join(settings.BASE_DIR, 'data', 'ingredients.csv'),
+            help='CSV (name,measurement_unit) или JSON с ингредиентами.'
+        )
+        parser.add_argument(
+            '--tags',
+            help='CSV (name,color,slug) или JSON с тегами.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument(
+            '--no-copy',
+            action='store_true',
+            help='Не использовать COPY даже на PostgreSQL.'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                if options['ingredients']:
+                    self.report('Ингредиенты', *self.load_ingredients(
+                        options['ingredients'],
+                        options['batch_size'],
+                        use_copy=(
+                            connection.vendor == 'postgresql'
+                            and not options['no_copy']
+                        )
+                    ))
+                if options['tags']:
+                    self.report('Теги', *self.load_tags(
+                        options['tags'], options['batch_size']
+                    ))
+        except IntegrityError as error:
+            raise CommandError(f'Ошибка загрузки: {error}')
+        ingredient_index.invalidate()
+        ingredient_cache.invalidate()
+        tag_cache.invalidate()
+
+    def report(self, label, created, updated, skipped, elapsed):
+        total = created + updated + skipped
+        rate = total / elapsed if elapsed else total
+        self.stdout.write(self.style.SUCCESS(
+            f'{label}: добавлено {created}, обновлено {updated}, '
+            f'пропущено {skipped} за {elapsed:.3f} с '
+            f'({rate:.0f} строк/с)'
+        ))
+
+    def load_ingredients(self, path, batch_size, use_copy):
+        started = time.perf_counter()
+        seen = set(
+            Ingredient.objects.values_list(*INGREDIENT_FIELDS).iterator()
+        )
+        created = skipped = 0
+        rows = read_rows(path, INGREDIENT_FIELDS)
+        for batch in batched(rows, batch_size):
+            new = []
+            for row in batch:
+                key = (row['name'], row['measurement_unit'])
+                if not row['name'] or key in seen:
+                    skipped += 1
+                    continue
+                seen.add(key)
+                new.append(key)
+            if use_copy:
+                self.copy_ingredients(new)
+            else:
+                Ingredient.objects.bulk_create(
+                    [Ingredient(name=name, measurement_unit=unit)
+                     for name, unit in new],
+                    batch_size=batch_size
+                )
+            created += len(new)
+        return created, 0, skipped, time.perf_counter() - started
+
+    def copy_ingredients(self, rows):
+        if not rows:
+            return
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(rows)
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.cursor.copy_expert(
+                'COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(
+                    Ingredient._meta.db_table, ', '.join(INGREDIENT_FIELDS)
+                ),
+                buffer
+            )
+
+    def load_tags(self, path, batch_size):
+        started = time.perf_counter()
+        existing = {tag.slug: tag for tag in Tag.objects.all()}
+        new = []
+        changed = []
+        skipped = 0
+        for row in read_rows(path, TAG_FIELDS):
+            tag = existing.get(row['slug'])
+            if tag is None:
+                tag = Tag(**row)
+                existing[tag.slug] = tag
+                new.append(tag)
+            elif (tag.name, tag.color) != (row['name'], row['color']):
+                tag.name = row['name']
+                tag.color = row['color']
+                if tag.pk:
+                    changed.append(tag)
+            else:
+                skipped += 1
+        Tag.objects.bulk_create(new, batch_size=batch_size)
+        Tag.objects.bulk_update(
+            changed, ['name', 'color'], batch_size=batch_size
+        )
+        return (
+            len(new), len(changed), skipped, time.perf_counter() - started
+        )
@@ -0,0 +1,64 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import ShoppingListTotal
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает или проверяет итоги списков покупок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Только сравнить таблицу с живой агрегацией.'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            self.verify()
+        else:
+            self.rebuild(options['batch_size'])
+
+    @transaction.atomic
+    def rebuild(self, batch_size):
+        ShoppingListTotal.objects.all().delete()
+        batch = []
+        created = 0
+        for user_id, ingredient_id, total in (
+            ShoppingListTotal.objects.live_totals().iterator()
+        ):
+            batch.append(ShoppingListTotal(
+                user_id=user_id, ingredient_id=ingredient_id, amount=total
+            ))
+            if len(batch) >= batch_size:
+                ShoppingListTotal.objects.bulk_create(batch)
+                created += len(batch)
+                batch = []
+        ShoppingListTotal.objects.bulk_create(batch)
+        created += len(batch)
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано строк: {created}'))
+
+    def verify(self):
+        stored = {
+            (user_id, ingredient_id): amount
+            for user_id, ingredient_id, amount in (
+                ShoppingListTotal.objects
+                .values_list('user_id', 'ingredient_id', 'amount')
+                .iterator()
+            )
+        }
+        mismatches = 0
+        for user_id, ingredient_id, total in (
+            ShoppingListTotal.objects.live_totals().iterator()
+        ):
+            if stored.pop((user_id, ingredient_id), None) != total:
+                mismatches += 1
+        mismatches += len(stored)
+        if mismatches:
+            raise CommandError(
+                f'Расхождений: {mismatches}. '
+                'Запустите команду без --verify для пересчёта.'
+            )
+        self.stdout.write(self.style.SUCCESS('Итоги совпадают.'))
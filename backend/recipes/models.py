@@ -1,20 +1,98 @@
+from functools import partial
+
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.core.validators import (MaxValueValidator, MinValueValidator,
                                     RegexValidator)
-from django.db import models
+from django.db import connections, models, transaction
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Greatest, RowNumber
 from django.utils import timezone
-from PIL import Image
 
 from django.conf import settings
+from users.models import Follow
+
+from . import images
 
 MAX_VALUE = settings.MAX_VALUE
 MIN_VALUE = settings.MIN_VALUE
-IMAGE_THUMBNAIL_SIZE = settings.IMAGE_THUMBNAIL_SIZE
 
 
 User = get_user_model()
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def for_read(self, user):
+        queryset = self.select_related('author').defer(
+            'search_vector'
+        ).prefetch_related(
+            'tags',
+            models.Prefetch(
+                'recipe_ingredient',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient'
+                )
+            )
+        )
+        if not user.is_authenticated:
+            return queryset.annotate(
+                is_favorited=models.Value(
+                    False, output_field=models.BooleanField()),
+                is_in_shopping_cart=models.Value(
+                    False, output_field=models.BooleanField()),
+                author_is_subscribed=models.Value(
+                    False, output_field=models.BooleanField()),
+            )
+        return queryset.annotate(
+            is_favorited=models.Exists(
+                Favorite.objects.filter(
+                    user=user, recipe=models.OuterRef('pk'))
+            ),
+            is_in_shopping_cart=models.Exists(
+                ShoppingList.objects.filter(
+                    user=user, recipe=models.OuterRef('pk'))
+            ),
+            author_is_subscribed=models.Exists(
+                Follow.objects.filter(
+                    user=user, author=models.OuterRef('author'))
+            ),
+        )
+
+    def latest_by_author(self, author_ids, limit):
+        """Newest ``limit`` recipes of each author in one windowed query."""
+        author_ids = list(author_ids)
+        if not author_ids or limit <= 0:
+            return self.none()
+        ranked = self.filter(author_id__in=author_ids).order_by().annotate(
+            row_number=models.Window(
+                RowNumber(),
+                partition_by=[models.F('author_id')],
+                order_by=[models.F('pub_date').desc(), models.F('id').desc()]
+            )
+        ).values('id', 'row_number')
+        sql, params = ranked.query.sql_with_params()
+        quote = connections[self.db].ops.quote_name
+        return self.filter(pk__in=RawSQL(
+            f'SELECT {quote("id")} FROM ({sql}) ranked '
+            f'WHERE {quote("row_number")} <= %s',
+            (*params, limit)
+        )).order_by('author_id', '-pub_date', '-id')
+
+    def update_search_vectors(self):
+        """Recompute ``search_vector`` from name (weight A) and text (B).
+
+        A no-op off PostgreSQL, where search uses an in-process index.
+        """
+        if connections[self.db].vendor != 'postgresql':
+            return 0
+        config = settings.RECIPE_SEARCH_CONFIG
+        return self.update(search_vector=(
+            SearchVector('name', weight='A', config=config)
+            + SearchVector('text', weight='B', config=config)
+        ))
+
+
 class Ingredient(models.Model):
     name = models.CharField('Ингредиент', max_length=255)
     measurement_unit = models.CharField('Единицы измерения', max_length=255)
@@ -55,7 +133,6 @@ class Recipe(models.Model):
     name = models.CharField(
         verbose_name='Название рецепта',
         max_length=255,
-        related_name='recipes_with_name'
     )
     author = models.ForeignKey(
         User,
@@ -87,6 +164,20 @@ class Recipe(models.Model):
         'Дата публикации',
         default=timezone.now
     )
+    favorites_count = models.PositiveIntegerField(
+        'В избранном', default=0, editable=False
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        'В корзинах', default=0, editable=False
+    )
+    search_vector = SearchVectorField(null=True, editable=False)
+    # False when the author was too popular to fan out to followers'
+    # feeds; such recipes are merged into feeds at read time for good.
+    fanned_out = models.BooleanField(
+        'Разослан в ленты', default=True, editable=False
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     def __str__(self):
         return self.name
@@ -95,14 +186,68 @@ class Recipe(models.Model):
         ordering = ['name']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'],
+                name='recipe_pub_date_id_idx'
+            ),
+            models.Index(
+                fields=['author', 'name'],
+                name='recipe_author_name_idx'
+            ),
+            models.Index(
+                fields=['-favorites_count', '-id'],
+                name='recipe_popularity_idx'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_not_fanned_out_idx',
+                condition=models.Q(fanned_out=False)
+            ),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['name'],
+                name='unique_recipe_name'
+            ),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if 'image' in field_names:
+            instance._stored_image = values[field_names.index('image')]
+        if 'name' in field_names and 'text' in field_names:
+            instance._stored_search_text = (
+                values[field_names.index('name')],
+                values[field_names.index('text')],
+            )
+        return instance
 
     def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            # Only update_search_vectors() writes the vector; a full save
+            # would put back the stale copy held in memory.
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name != 'search_vector'
+            ]
         super().save(*args, **kwargs)
+        update_fields = kwargs.get('update_fields')
+        search_text = (self.name, self.text)
+        if (
+            update_fields is None or {'name', 'text'} & set(update_fields)
+        ) and search_text != getattr(self, '_stored_search_text', None):
+            Recipe.objects.filter(pk=self.pk).update_search_vectors()
+            self._stored_search_text = search_text
 
-        if self.image:
-            img = Image.open(self.image.path)
-            img.thumbnail(IMAGE_THUMBNAIL_SIZE)
-            img.save(self.image.path)
+        if self.image and self.image.name != getattr(
+            self, '_stored_image', None
+        ):
+            self._stored_image = self.image.name
+            transaction.on_commit(partial(
+                images.schedule, self.image.storage, self.image.name
+            ))
 
 
 class RecipeIngredient(models.Model):
@@ -131,6 +276,14 @@ class RecipeIngredient(models.Model):
     class Meta:
         verbose_name = 'Ингредиент рецепта'
         verbose_name_plural = 'Ингредиенты рецепта'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'ingredient'],
+                name='unique_recipe_ingredient'
+            )
+        ]
+        # recipe_ingredient_lookup_idx, a covering index, is created on
+        # PostgreSQL only (recipes/postgres.py).
 
 
 class ShoppingList(models.Model):
@@ -156,11 +309,113 @@ class ShoppingList(models.Model):
                 name='unique_shopping_cart'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'user'],
+                name='shopping_cart_recipe_user_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'Список покупок #{self.pk} - {self.user.username}'
 
 
+class ShoppingListTotalQuerySet(models.QuerySet):
+
+    def apply_recipe(self, recipe, users, sign=1):
+        """Add (sign=1) or remove (sign=-1) recipe amounts for users."""
+        self.apply_recipes([recipe.pk], users, sign)
+
+    def apply_recipes(self, recipe_ids, users, sign=1):
+        """Like ``apply_recipe`` for several recipes at once."""
+        user_ids = list(users)
+        if not user_ids or not recipe_ids:
+            return
+        ingredient_ids = list(
+            RecipeIngredient.objects
+            .filter(recipe_id__in=recipe_ids)
+            .order_by()
+            .values_list('ingredient_id', flat=True)
+            .distinct()
+        )
+        if not ingredient_ids:
+            return
+        if sign > 0:
+            self.bulk_create(
+                [
+                    ShoppingListTotal(
+                        user_id=user_id, ingredient_id=ingredient_id, amount=0
+                    )
+                    for user_id in user_ids
+                    for ingredient_id in ingredient_ids
+                ],
+                ignore_conflicts=True
+            )
+        amounts = (
+            RecipeIngredient.objects
+            .filter(
+                recipe_id__in=recipe_ids,
+                ingredient=models.OuterRef('ingredient')
+            )
+            .values('ingredient')
+            .annotate(total=models.Sum('amount'))
+            .values('total')
+        )
+        self.filter(
+            user_id__in=user_ids, ingredient_id__in=ingredient_ids
+        ).update(
+            amount=Greatest(
+                models.F('amount') + sign * models.Subquery(
+                    amounts, output_field=models.PositiveIntegerField()
+                ),
+                0
+            )
+        )
+        if sign < 0:
+            self.filter(user_id__in=user_ids, amount=0).delete()
+
+    def live_totals(self):
+        return (
+            RecipeIngredient.objects
+            .filter(recipe__shopping_cart__isnull=False)
+            .values('recipe__shopping_cart__user', 'ingredient')
+            .annotate(total=models.Sum('amount'))
+            .values_list('recipe__shopping_cart__user', 'ingredient', 'total')
+            .order_by()
+        )
+
+
+class ShoppingListTotal(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_totals',
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_totals',
+        verbose_name='Ингредиент'
+    )
+    amount = models.PositiveIntegerField('Количество', default=0)
+
+    objects = ShoppingListTotalQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_total'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.ingredient}: {self.amount}'
+
+
 class Favorite(models.Model):
     user = models.ForeignKey(
         User,
@@ -172,7 +427,9 @@ class Favorite(models.Model):
         Recipe,
         on_delete=models.CASCADE,
         related_name='favorites',
-        verbose_name='Понравившиеся'
+        verbose_name='Понравившиеся',
+        # Covered by favorite_recipe_user_idx, which starts with it.
+        db_index=False
     )
 
     class Meta:
@@ -184,6 +441,137 @@ class Favorite(models.Model):
                 name='unique_favorite'
             )
         ]
+        indexes = [
+            models.Index(
+                fields=['recipe', 'user'],
+                name='favorite_recipe_user_idx'
+            ),
+        ]
 
     def __str__(self):
         return f'{self.user.username} - {self.recipe.name}'
+
+
+class FeedEntry(models.Model):
+    """A recipe fanned out into a follower's activity feed."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Пользователь'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+    pub_date = models.DateTimeField('Дата публикации')
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи ленты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_entry_user_pub_date_idx'
+            ),
+            models.Index(
+                fields=['user', 'author'],
+                name='feed_entry_user_author_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.recipe}'
+
+
+class SimilarRecipe(models.Model):
+    """A precomputed neighbour of a recipe; see ``recommendations``."""
+
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='+',
+        # Covered by the indexes below, which start with this column.
+        db_index=False,
+        verbose_name='Рецепт'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_to',
+        verbose_name='Похожий рецепт'
+    )
+    score = models.FloatField('Сходство')
+
+    class Meta:
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='unique_similar_recipe'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['recipe', '-score'],
+                name='similar_recipe_score_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} ~ {self.similar}'
+
+
+class RecommendedRecipe(models.Model):
+    """A precomputed recommendation; see ``recommendations``."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        # Covered by the indexes below, which start with this column.
+        db_index=False,
+        verbose_name='Пользователь'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='recommended_to',
+        verbose_name='Рецепт'
+    )
+    score = models.FloatField('Оценка')
+
+    class Meta:
+        verbose_name = 'Рекомендация'
+        verbose_name_plural = 'Рекомендации'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_recommended_recipe'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-score'],
+                name='recommended_user_score_idx'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user} - {self.recipe}'
@@ -0,0 +1,59 @@
+import logging
+
+from django.db import DatabaseError, connections, transaction
+
+logger = logging.getLogger(__name__)
+
+# (required extension or None, statement)
+POSTGRES_INDEXES = (
+    # Prefix lookups: UPPER(name::text) LIKE UPPER('q%').
+    (None,
+     'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_prefix_idx '
+     'ON recipes_ingredient (UPPER(name::text) text_pattern_ops)'),
+    # Substring lookups: UPPER(name::text) LIKE UPPER('%q%').
+    ('pg_trgm',
+     'CREATE INDEX IF NOT EXISTS recipes_ingredient_name_trgm_idx '
+     'ON recipes_ingredient USING gin (UPPER(name::text) gin_trgm_ops)'),
+    # Full-text recipe search: search_vector @@ websearch_to_tsquery(...).
+    (None,
+     'CREATE INDEX IF NOT EXISTS recipes_recipe_search_vector_idx '
+     'ON recipes_recipe USING gin (search_vector)'),
+    # Recipes and amounts by ingredient from the index alone. SQLite has
+    # no INCLUDE and keeps the plain foreign key index.
+    (None,
+     'CREATE INDEX IF NOT EXISTS recipe_ingredient_lookup_idx '
+     'ON recipes_recipeingredient (ingredient_id, recipe_id) '
+     'INCLUDE (amount)'),
+)
+
+
+def create_extension(connection, extension):
+    """Return whether ``extension`` is available, creating it if needed."""
+    try:
+        with transaction.atomic(using=connection.alias):
+            with connection.cursor() as cursor:
+                cursor.execute(f'CREATE EXTENSION IF NOT EXISTS {extension}')
+    except DatabaseError as error:
+        logger.warning(
+            'Расширение %s недоступно, связанные индексы пропущены: %s',
+            extension, error
+        )
+        return False
+    return True
+
+
+def create_postgres_indexes(sender, using='default', **kwargs):
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    extensions = {}
+    for extension, statement in POSTGRES_INDEXES:
+        if extension is not None:
+            if extension not in extensions:
+                extensions[extension] = create_extension(
+                    connection, extension
+                )
+            if not extensions[extension]:
+                continue
+        with connection.cursor() as cursor:
+            cursor.execute(statement)
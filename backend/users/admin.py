@@ -10,7 +10,9 @@ class CustomUserAdmin(UserAdmin):
         'email',
         'first_name',
         'last_name',
-        'is_active'
+        'is_active',
+        'recipes_count',
+        'followers_count'
     )
     list_filter = ('is_active', 'first_name', 'email')
     search_fields = ('username', 'email')